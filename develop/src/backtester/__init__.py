@@ -1 +1,2 @@
-from .backtester_v1 import BacktesterV1
+from .backtester_v1 import BacktesterV1, run_batch
+from .backtester_v2 import BacktesterV2
@@ -1,6 +1,10 @@
 import os
-from .utils import nan_to_zero
+import numpy as np
+import pandas as pd
+from collections import OrderedDict, defaultdict
+from .utils import nan_to_zero, to_array
 from .basic_backtester import BasicBacktester
+from .kernels import run_backtest_kernel
 from tqdm import tqdm
 import gc
 
@@ -26,6 +30,7 @@ CONFIG = {
     "positive_probability_threshold": 8,
     "negative_probability_threshold": 8,
     "adjust_prediction": False,
+    "use_kernel": False,
 }
 
 
@@ -55,6 +60,7 @@ class BacktesterV1(BasicBacktester):
         positive_probability_threshold=CONFIG["positive_probability_threshold"],
         negative_probability_threshold=CONFIG["negative_probability_threshold"],
         adjust_prediction=CONFIG["adjust_prediction"],
+        use_kernel=CONFIG["use_kernel"],
     ):
         super().__init__(
             base_currency=base_currency,
@@ -82,10 +88,41 @@ class BacktesterV1(BasicBacktester):
             adjust_prediction=adjust_prediction,
         )
 
-    def run(self, display=True):
-        self.build()
-        self.initialize()
+        # Run compiled kernel over arrays instead of Position objects
+        self.use_kernel = use_kernel
+        if self.use_kernel is True:
+            assert self.detail_report is False
+
+    def build_kernel_params(self):
+        exit_bins = np.zeros(len(self.tradable_coins))
+        if self.exit_bins is not None:
+            exit_bins = self.exit_bins[self.tradable_coins].values.astype("float64")
+
+        return {
+            "exit_bins": exit_bins,
+            "long_enabled": self.position_side in ("long", "longshort"),
+            "short_enabled": self.position_side in ("short", "longshort"),
+            "entry_ratio": float(self.entry_ratio),
+            "commission_entry": float(self.commission["entry"]),
+            "commission_exit": float(self.commission["exit"]),
+            "commission_spread": float(self.commission["spread"]),
+            "min_holding_minutes": float(self.min_holding_minutes),
+            "max_holding_minutes": float(self.max_holding_minutes),
+            "compound_interest": self.compound_interest,
+            "order_by_capital": self.order_criterion == "capital",
+            "possible_in_debt": self.possible_in_debt,
+            "exit_if_achieved": self.exit_if_achieved,
+            "achieve_ratio": float(self.achieve_ratio),
+            "achieved_with_commission": self.achieved_with_commission,
+            "max_n_updated": -1 if self.max_n_updated is None else self.max_n_updated,
+            "exit_threshold_auto": self.exit_threshold == "auto",
+            "adjust_prediction": self.adjust_prediction,
+        }
 
+    def run_kernel(self):
+        run_kernel_batch(backtesters=[self])
+
+    def run_loop(self):
         for now in tqdm(self.index):
             # Step1: Prepare pricing and signal
             pricing = self.historical_data_dict["pricing"].loc[now]
@@ -150,6 +187,15 @@ class BacktesterV1(BasicBacktester):
             )
             self.report(value=self.positions, target="historical_positions", now=now)
 
+    def run(self, display=True, historical_data_dict=None):
+        self.build(historical_data_dict=historical_data_dict)
+        self.initialize()
+
+        if self.use_kernel is True:
+            self.run_kernel()
+        else:
+            self.run_loop()
+
         report = self.generate_report()
         self.store_report(report=report)
 
@@ -162,6 +208,129 @@ class BacktesterV1(BasicBacktester):
         gc.collect()
 
 
+def run_kernel_batch(backtesters):
+    """
+    Advance all backtesters together in one pass of the compiled kernel.
+    Backtesters should be built on the same historical_data_dict.
+    """
+    base = backtesters[0]
+    for backtester in backtesters:
+        assert backtester.historical_data_dict is base.historical_data_dict
+
+    def _to_array(data):
+        return to_array(data=data, columns=base.tradable_coins)
+
+    def _signal_key(backtester):
+        return tuple(
+            str(threshold)
+            for threshold in (
+                backtester.positive_entry_threshold,
+                backtester.negative_entry_threshold,
+                backtester.positive_probability_threshold,
+                backtester.negative_probability_threshold,
+            )
+        )
+
+    # Combos with the same entry and probability thresholds share their signals
+    signal_sets = OrderedDict()
+    for backtester in backtesters:
+        key = _signal_key(backtester)
+        if key not in signal_sets:
+            signal_sets[key] = (len(signal_sets), backtester)
+
+    signal_bins = {
+        key: np.stack(
+            [
+                _to_array(getattr(backtester, key))
+                for _, backtester in signal_sets.values()
+            ]
+        )
+        for key in (
+            "positive_entry_bins",
+            "negative_entry_bins",
+            "positive_probability_bins",
+            "negative_probability_bins",
+        )
+    }
+
+    kernel_params = [backtester.build_kernel_params() for backtester in backtesters]
+    kernel_params = {
+        key: np.array([params[key] for params in kernel_params])
+        for key in kernel_params[0].keys()
+    }
+
+    (
+        caches,
+        capitals,
+        trade_returns,
+        trade_return_indices,
+        trade_return_combos,
+    ) = run_backtest_kernel(
+        pricing=_to_array(base.historical_data_dict["pricing"]),
+        predictions=_to_array(base.historical_data_dict["predictions"]),
+        probabilities=_to_array(base.historical_data_dict["probabilities"]),
+        timestamps=base.index.values.astype("datetime64[ns]").astype("int64"),
+        signal_set_ids=np.array(
+            [signal_sets[_signal_key(backtester)][0] for backtester in backtesters]
+        ),
+        **signal_bins,
+        **kernel_params,
+    )
+
+    for combo, backtester in enumerate(backtesters):
+        backtester.historical_caches = pd.Series(caches[:, combo], index=base.index)
+        backtester.historical_capitals = pd.Series(capitals[:, combo], index=base.index)
+        backtester.historical_trade_returns = defaultdict(list)
+
+    for trade_return, now, combo in zip(
+        trade_returns, base.index[trade_return_indices], trade_return_combos
+    ):
+        backtesters[combo].historical_trade_returns[now].append(trade_return)
+
+
+def run_batch(backtesters, display=False, historical_data_dict=None):
+    """
+    Run BacktesterV1s of a parameter grid in one time loop, instead of a pass for each.
+    Backtesters should share base_currency, dataset_dir and exp_dir.
+    """
+    assert len(backtesters) != 0
+    assert (
+        len(
+            set(
+                (backtester.base_currency, backtester.dataset_dir, backtester.exp_dir)
+                for backtester in backtesters
+            )
+        )
+        == 1
+    )
+    for backtester in backtesters:
+        assert isinstance(backtester, BacktesterV1)
+        assert backtester.detail_report is False
+
+    if historical_data_dict is None:
+        historical_data_dict = backtesters[0].load_historical_data_dict()
+
+    for backtester in backtesters:
+        backtester.build(historical_data_dict=historical_data_dict)
+        backtester.initialize()
+
+    run_kernel_batch(backtesters=backtesters)
+
+    for backtester in backtesters:
+        report = backtester.generate_report()
+        backtester.store_report(report=report)
+
+        if display is True:
+            backtester.display_metrics()
+            backtester.display_report(report=report)
+
+        # Remove historical data dict to reduce memory usage
+        del backtester.historical_data_dict
+
+    del historical_data_dict
+    gc.collect()
+
+
 if __name__ == "__main__":
     import fire
 
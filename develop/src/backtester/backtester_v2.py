@@ -0,0 +1,495 @@
+import numpy as np
+import pandas as pd
+from .utils import nan_to_zero, to_array
+from .basic_backtester import BasicBacktester
+from tqdm import tqdm
+import gc
+
+
+CONFIG = {
+    "report_prefix": "v001",
+    "detail_report": False,
+    "position_side": "longshort",
+    "entry_ratio": 0.055,
+    "commission": {"entry": 0.0004, "exit": 0.0002, "spread": 0.0004},
+    "min_holding_minutes": 1,
+    "max_holding_minutes": 30,
+    "compound_interest": True,
+    "order_criterion": "capital",
+    "possible_in_debt": True,
+    "exit_if_achieved": True,
+    "achieve_ratio": 1,
+    "achieved_with_commission": False,
+    "max_n_updated": 0,
+    "positive_entry_threshold": 8,
+    "negative_entry_threshold": 8,
+    "exit_threshold": "auto",
+    "positive_probability_threshold": 8,
+    "negative_probability_threshold": 8,
+    "adjust_prediction": False,
+}
+NANOSECONDS_PER_MINUTE = 60 * 10 ** 9
+LONG = 1
+SHORT = -1
+
+
+class BacktesterV2(BasicBacktester):
+    """
+    Same trading rules with BacktesterV1, but signals are precomputed as boolean
+    matrices, and only the minutes where a signal or an exit condition (achieved,
+    max_holding_minutes) can occur are stepped through. Cache and capital in between
+    are filled at once. Only one position per asset can exist, so positions are kept
+    in per-asset arrays.
+    """
+
+    # Rows to look ahead at once for achievement of a position
+    achievement_lookahead = 1440
+
+    def __init__(
+        self,
+        base_currency,
+        dataset_dir,
+        exp_dir,
+        report_prefix=CONFIG["report_prefix"],
+        detail_report=CONFIG["detail_report"],
+        position_side=CONFIG["position_side"],
+        entry_ratio=CONFIG["entry_ratio"],
+        commission=CONFIG["commission"],
+        min_holding_minutes=CONFIG["min_holding_minutes"],
+        max_holding_minutes=CONFIG["max_holding_minutes"],
+        compound_interest=CONFIG["compound_interest"],
+        order_criterion=CONFIG["order_criterion"],
+        possible_in_debt=CONFIG["possible_in_debt"],
+        exit_if_achieved=CONFIG["exit_if_achieved"],
+        achieve_ratio=CONFIG["achieve_ratio"],
+        achieved_with_commission=CONFIG["achieved_with_commission"],
+        max_n_updated=CONFIG["max_n_updated"],
+        positive_entry_threshold=CONFIG["positive_entry_threshold"],
+        negative_entry_threshold=CONFIG["negative_entry_threshold"],
+        exit_threshold=CONFIG["exit_threshold"],
+        positive_probability_threshold=CONFIG["positive_probability_threshold"],
+        negative_probability_threshold=CONFIG["negative_probability_threshold"],
+        adjust_prediction=CONFIG["adjust_prediction"],
+    ):
+        # Historical positions are not kept in arrays
+        assert detail_report is False
+
+        super().__init__(
+            base_currency=base_currency,
+            dataset_dir=dataset_dir,
+            exp_dir=exp_dir,
+            report_prefix=report_prefix,
+            detail_report=detail_report,
+            position_side=position_side,
+            entry_ratio=entry_ratio,
+            commission=commission,
+            min_holding_minutes=min_holding_minutes,
+            max_holding_minutes=max_holding_minutes,
+            compound_interest=compound_interest,
+            order_criterion=order_criterion,
+            possible_in_debt=possible_in_debt,
+            exit_if_achieved=exit_if_achieved,
+            achieve_ratio=achieve_ratio,
+            achieved_with_commission=achieved_with_commission,
+            max_n_updated=max_n_updated,
+            positive_entry_threshold=positive_entry_threshold,
+            negative_entry_threshold=negative_entry_threshold,
+            exit_threshold=exit_threshold,
+            positive_probability_threshold=positive_probability_threshold,
+            negative_probability_threshold=negative_probability_threshold,
+            adjust_prediction=adjust_prediction,
+        )
+
+    def build_arrays(self):
+        self.pricing = to_array(
+            data=self.historical_data_dict["pricing"], columns=self.tradable_coins
+        )
+        self.predictions = to_array(
+            data=self.historical_data_dict["predictions"], columns=self.tradable_coins
+        )
+        probabilities = to_array(
+            data=self.historical_data_dict["probabilities"], columns=self.tradable_coins
+        )
+
+        # Set signals of all minutes at once, nan is never a signal
+        self.positive_signals = (
+            self.predictions >= self.positive_entry_bins.values.astype("float64")
+        ) & (probabilities >= self.positive_probability_bins.values.astype("float64"))
+        self.negative_signals = (
+            self.predictions <= self.negative_entry_bins.values.astype("float64")
+        ) & (probabilities >= self.negative_probability_bins.values.astype("float64"))
+        self.signal_indices = np.flatnonzero(
+            (self.positive_signals | self.negative_signals).any(axis=1)
+        )
+
+        self.exit_bin_values = None
+        if self.exit_bins is not None:
+            self.exit_bin_values = self.exit_bins.values.astype("float64")
+
+        self.timestamps = self.index.values.astype("datetime64[ns]").astype("int64")
+
+    def initialize_positions(self):
+        n_assets = len(self.tradable_coins)
+
+        self.position_sides = np.zeros(n_assets, dtype=np.int8)
+        self.position_qtys = np.zeros(n_assets)
+        self.position_entry_prices = np.zeros(n_assets)
+        self.position_predictions = np.zeros(n_assets)
+        self.position_entry_indices = np.zeros(n_assets, dtype=np.int64)
+        self.position_n_updated = np.zeros(n_assets, dtype=np.int64)
+        self.position_next_indices = np.zeros(n_assets, dtype=np.int64)
+
+        # Assets in order of entry, same with the order of positions in BacktesterV1
+        self.open_assets = []
+
+    def compute_capital(self, pricing, now=None):
+        # pricing: prices of one minute (asset) or minutes (time x asset)
+        capital = self.cache
+
+        for asset in self.open_assets:
+            current_price = pricing[..., asset]
+            qty = self.position_qtys[asset]
+            entry_price = self.position_entry_prices[asset]
+
+            if self.position_sides[asset] == LONG:
+                capital = capital + current_price * qty
+
+            if self.position_sides[asset] == SHORT:
+                capital = capital + entry_price * qty
+                capital = capital + (current_price - entry_price) * qty * -1
+
+        return capital
+
+    def check_if_achieved(self, asset, current_price):
+        # Broadcasted: assets at a minute, or an asset at minutes
+        side = self.position_sides[asset]
+        entry_price = self.position_entry_prices[asset]
+
+        diff_price = current_price - entry_price
+        if self.achieved_with_commission is True:
+            commission = (
+                current_price * (self.commission["exit"] + self.commission["spread"])
+            ) + (entry_price * (self.commission["entry"] + self.commission["spread"]))
+            commission = commission * side
+
+            diff_price = diff_price - commission
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            trade_return = np.where(diff_price != 0, diff_price / entry_price, 0)
+
+        trade_return = trade_return / self.achieve_ratio
+
+        if self.exit_threshold == "auto":
+            threshold = self.position_predictions[asset]
+            assert np.all((threshold * side) > 0)
+        else:
+            threshold = self.exit_bin_values[asset] * side
+
+        return np.where(
+            side == LONG, trade_return >= threshold, trade_return <= threshold
+        )
+
+    def compute_next_index(self, asset, start):
+        # The first index where the position can be exited, since start
+        n_rows = len(self.index)
+        entry_timestamp = self.timestamps[self.position_entry_indices[asset]]
+
+        # passed_minutes > min_holding_minutes and passed_minutes >= max_holding_minutes
+        exit_index = max(
+            start,
+            np.searchsorted(
+                self.timestamps,
+                entry_timestamp
+                + int(np.floor(self.min_holding_minutes * NANOSECONDS_PER_MINUTE)),
+                side="right",
+            ),
+            np.searchsorted(
+                self.timestamps,
+                entry_timestamp
+                + int(np.ceil(self.max_holding_minutes * NANOSECONDS_PER_MINUTE)),
+                side="left",
+            ),
+        )
+
+        if self.exit_if_achieved is not True:
+            return min(exit_index, n_rows)
+
+        # Look ahead for achievement until exit_index, re-check later if it is far
+        end_index = min(exit_index, start + self.achievement_lookahead, n_rows)
+        achieved_indices = np.flatnonzero(
+            self.check_if_achieved(
+                asset=asset, current_price=self.pricing[start:end_index, asset]
+            )
+        )
+        if len(achieved_indices) != 0:
+            return start + achieved_indices[0]
+
+        return end_index
+
+    def exit_order(self, asset, current_price, now, achieved=False):
+        qty = self.position_qtys[asset]
+        entry_price = self.position_entry_prices[asset]
+
+        if self.position_sides[asset] == LONG:
+            profit_without_commission = current_price * qty
+
+        if self.position_sides[asset] == SHORT:
+            profit_without_commission = entry_price * qty
+            profit_without_commission += (current_price - entry_price) * qty * -1
+
+        exit_commission = self.commission["exit"]
+        if achieved is not True:
+            exit_commission = (self.commission["exit"] * 2) + self.commission["spread"]
+
+        profit = profit_without_commission - (
+            profit_without_commission * exit_commission
+        )
+        self.deposit_cache(profit=profit)
+
+        net_profit = profit - (entry_price * qty)
+        self.report(
+            value=(net_profit / (entry_price * qty)),
+            target="historical_trade_returns",
+            now=now,
+            append=True,
+        )
+
+        self.position_sides[asset] = 0
+        self.open_assets.remove(asset)
+
+    def handle_exit(self, idx, pricing, positive_signals, negative_signals):
+        now = self.index[idx]
+        open_assets = list(self.open_assets)
+
+        if self.exit_if_achieved is True:
+            achieved = self.check_if_achieved(
+                asset=open_assets, current_price=pricing[open_assets]
+            )
+
+        for position_idx, asset in enumerate(open_assets):
+            side = self.position_sides[asset]
+
+            # Handle achievement
+            if self.exit_if_achieved is True:
+                if achieved[position_idx]:
+                    self.exit_order(
+                        asset=asset,
+                        current_price=pricing[asset],
+                        now=now,
+                        achieved=True,
+                    )
+                    continue
+
+            # Keep position if matched
+            if (side == LONG) and positive_signals[asset]:
+                continue
+
+            if (side == SHORT) and negative_signals[asset]:
+                continue
+
+            passed_minutes = (
+                (
+                    self.timestamps[idx]
+                    - self.timestamps[self.position_entry_indices[asset]]
+                )
+                / 10 ** 9
+            ) / 60
+
+            # Handle min_holding_minutes
+            if passed_minutes <= self.min_holding_minutes:
+                continue
+
+            # Handle max_holding_minutes
+            if passed_minutes >= self.max_holding_minutes:
+                self.exit_order(asset=asset, current_price=pricing[asset], now=now)
+                continue
+
+            # Handle exit signal
+            if ((side == LONG) and negative_signals[asset]) or (
+                (side == SHORT) and positive_signals[asset]
+            ):
+                self.exit_order(asset=asset, current_price=pricing[asset], now=now)
+                continue
+
+    def entry_order(self, idx, asset, side, cache_to_order, entry_price, prediction):
+        if cache_to_order == 0:
+            return False
+
+        # if opposite position exists, we dont entry
+        if self.position_sides[asset] == -side:
+            return False
+
+        qty = cache_to_order / entry_price
+        cost = (entry_price * qty) + (
+            (entry_price * qty) * (self.commission["entry"] + self.commission["spread"])
+        )
+
+        if self.position_sides[asset] == side:
+            # Skip when max_n_updated is None
+            if self.max_n_updated is None:
+                return False
+
+            # Update only prediction, and entry_at
+            if self.position_n_updated[asset] == self.max_n_updated:
+                if self.adjust_prediction is True:
+                    self.position_predictions[asset] = self.compute_adjusted_prediction(
+                        side="long" if side == LONG else "short",
+                        entry_price=self.position_entry_prices[asset],
+                        current_price=entry_price,
+                        entry_prediction=self.position_predictions[asset],
+                        current_prediction=prediction,
+                    )
+
+                self.position_entry_indices[asset] = idx
+                return True
+
+            if self.check_if_executable_order(cost=cost) is not True:
+                return False
+
+            # Update entry_price, entry_at and qty
+            exist_qty = self.position_qtys[asset]
+            self.position_entry_prices[asset] = (
+                (self.position_entry_prices[asset] * exist_qty) + (entry_price * qty)
+            ) / (exist_qty + qty)
+            self.position_predictions[asset] = (
+                (self.position_predictions[asset] * exist_qty) + (prediction * qty)
+            ) / (exist_qty + qty)
+            self.position_qtys[asset] = exist_qty + qty
+            self.position_entry_indices[asset] = idx
+            self.position_n_updated[asset] += 1
+
+            self.pay_cache(cost=cost)
+            return True
+
+        if self.check_if_executable_order(cost=cost) is not True:
+            return False
+
+        self.position_sides[asset] = side
+        self.position_qtys[asset] = qty
+        self.position_entry_prices[asset] = entry_price
+        self.position_predictions[asset] = prediction
+        self.position_entry_indices[asset] = idx
+        self.position_n_updated[asset] = 0
+        self.open_assets.append(asset)
+
+        self.pay_cache(cost=cost)
+        return True
+
+    def handle_entry(self, idx, pricing, positive_signals, negative_signals):
+        # Compute how much use cache
+        if self.compound_interest is False:
+            cache_to_order = self.entry_ratio
+        else:
+            if self.order_criterion == "cache":
+                if self.cache > 0:
+                    cache_to_order = nan_to_zero(value=(self.cache * self.entry_ratio))
+                else:
+                    cache_to_order = 0
+
+            elif self.order_criterion == "capital":
+                # Entry with capital base
+                cache_to_order = nan_to_zero(
+                    value=(self.compute_capital(pricing=pricing) * self.entry_ratio)
+                )
+
+        entered_assets = []
+        for side, signals in [(LONG, positive_signals), (SHORT, negative_signals)]:
+            if (side == LONG) and (self.position_side not in ("long", "longshort")):
+                continue
+
+            if (side == SHORT) and (self.position_side not in ("short", "longshort")):
+                continue
+
+            for asset in np.flatnonzero(signals):
+                if self.entry_order(
+                    idx=idx,
+                    asset=asset,
+                    side=side,
+                    cache_to_order=cache_to_order,
+                    entry_price=pricing[asset],
+                    prediction=self.predictions[idx, asset],
+                ):
+                    entered_assets.append(asset)
+
+        return entered_assets
+
+    def step(self, idx):
+        pricing = self.pricing[idx]
+        positive_signals = self.positive_signals[idx]
+        negative_signals = self.negative_signals[idx]
+
+        self.handle_exit(
+            idx=idx,
+            pricing=pricing,
+            positive_signals=positive_signals,
+            negative_signals=negative_signals,
+        )
+        entered_assets = self.handle_entry(
+            idx=idx,
+            pricing=pricing,
+            positive_signals=positive_signals,
+            negative_signals=negative_signals,
+        )
+
+        # Update the next index to check of positions which are changed or reached
+        for asset in self.open_assets:
+            if (asset in entered_assets) or (self.position_next_indices[asset] <= idx):
+                self.position_next_indices[asset] = self.compute_next_index(
+                    asset=asset, start=idx + 1
+                )
+
+    def run(self, display=True, historical_data_dict=None):
+        self.build(historical_data_dict=historical_data_dict)
+        self.initialize()
+        self.build_arrays()
+        self.initialize_positions()
+
+        n_rows = len(self.index)
+        historical_caches = np.ones(n_rows)
+        historical_capitals = np.ones(n_rows)
+
+        idx = self.signal_indices[0] if len(self.signal_indices) != 0 else n_rows
+        with tqdm(total=n_rows, initial=idx) as progress:
+            while idx < n_rows:
+                self.step(idx=idx)
+
+                # Next minute which has a signal, or a position to check
+                next_idx = n_rows
+                signal_idx = np.searchsorted(self.signal_indices, idx, side="right")
+                if signal_idx < len(self.signal_indices):
+                    next_idx = self.signal_indices[signal_idx]
+
+                if len(self.open_assets) != 0:
+                    next_idx = min(
+                        next_idx, self.position_next_indices[self.open_assets].min()
+                    )
+
+                # Nothing changes until next_idx
+                historical_caches[idx:next_idx] = self.cache
+                historical_capitals[idx:next_idx] = self.compute_capital(
+                    pricing=self.pricing[idx:next_idx]
+                )
+
+                progress.update(next_idx - idx)
+                idx = next_idx
+
+        self.historical_caches = pd.Series(historical_caches, index=self.index)
+        self.historical_capitals = pd.Series(historical_capitals, index=self.index)
+
+        report = self.generate_report()
+        self.store_report(report=report)
+
+        if display is True:
+            self.display_metrics()
+            self.display_report(report=report)
+
+        # Remove historical data to reduce memory usage
+        del self.historical_data_dict
+        del self.pricing, self.predictions, self.positive_signals, self.negative_signals
+        gc.collect()
+
+
+if __name__ == "__main__":
+    import fire
+
+    fire.Fire(BacktesterV2)
@@ -221,11 +221,8 @@ class BasicBacktester:
                 self.negative_probability_threshold
             ][index]
 
-    def build(self):
-        self.report_store_dir = os.path.join(self.exp_dir, "reports/")
-        make_dirs([self.report_store_dir])
-
-        self.historical_data_dict = self._build_historical_data_dict(
+    def load_historical_data_dict(self):
+        historical_data_dict = self._build_historical_data_dict(
             base_currency=self.base_currency,
             historical_data_path_dict={
                 "pricing": os.path.join(self.dataset_dir, "test/pricing.parquet.zstd"),
@@ -240,15 +237,26 @@ class BasicBacktester:
                 ),
             },
         )
-        self.tradable_coins = self.historical_data_dict["predictions"].columns
-        self.index = (
-            self.historical_data_dict["predictions"].index
-            & self.historical_data_dict["pricing"].index
+        index = (
+            historical_data_dict["predictions"].index
+            & historical_data_dict["pricing"].index
         ).sort_values()
-        for key in self.historical_data_dict.keys():
-            self.historical_data_dict[key] = self.historical_data_dict[key].reindex(
-                self.index
-            )
+        for key in historical_data_dict.keys():
+            historical_data_dict[key] = historical_data_dict[key].reindex(index)
+
+        return historical_data_dict
+
+    def build(self, historical_data_dict=None):
+        self.report_store_dir = os.path.join(self.exp_dir, "reports/")
+        make_dirs([self.report_store_dir])
+
+        # historical_data_dict can be given, when it is loaded once and shared
+        if historical_data_dict is None:
+            historical_data_dict = self.load_historical_data_dict()
+
+        self.historical_data_dict = historical_data_dict
+        self.tradable_coins = self.historical_data_dict["predictions"].columns
+        self.index = self.historical_data_dict["predictions"].index
 
         prediction_abs_bins = self._load_prediction_abs_bins()
         probability_bins = self._load_probability_bins()
@@ -0,0 +1,416 @@
+import numpy as np
+from numba import njit
+
+
+LONG = 1
+SHORT = -1
+
+
+@njit(cache=True)
+def nan_to_zero(value):
+    if np.isnan(value):
+        return 0.0
+
+    return value
+
+
+@njit(cache=True)
+def compute_capital(
+    cache, current_prices, open_assets, n_open, sides, qtys, entry_prices
+):
+    # capital = cache + value of positions
+    capital = cache
+
+    for position_idx in range(n_open):
+        asset = open_assets[position_idx]
+        current_price = current_prices[asset]
+
+        if sides[asset] == LONG:
+            capital += current_price * qtys[asset]
+
+        if sides[asset] == SHORT:
+            capital += entry_prices[asset] * qtys[asset]
+            capital += (current_price - entry_prices[asset]) * qtys[asset] * -1
+
+    return capital
+
+
+@njit(cache=True)
+def check_if_achieved(
+    side,
+    entry_price,
+    prediction,
+    current_price,
+    exit_bin,
+    commission_entry,
+    commission_exit,
+    commission_spread,
+    achieve_ratio,
+    achieved_with_commission,
+    exit_threshold_auto,
+):
+    diff_price = current_price - entry_price
+    if achieved_with_commission:
+        commission = (current_price * (commission_exit + commission_spread)) + (
+            entry_price * (commission_entry + commission_spread)
+        )
+        if side == SHORT:
+            commission = -commission
+
+        diff_price = diff_price - commission
+
+    if diff_price != 0:
+        trade_return = diff_price / entry_price
+    else:
+        trade_return = 0.0
+
+    trade_return = trade_return / achieve_ratio
+
+    if exit_threshold_auto:
+        if side == LONG:
+            assert prediction > 0
+            return trade_return >= prediction
+
+        assert prediction < 0
+        return trade_return <= prediction
+
+    if side == LONG:
+        return trade_return >= exit_bin
+
+    return trade_return <= -exit_bin
+
+
+@njit(cache=True)
+def compute_adjusted_prediction(
+    side, entry_price, current_price, entry_prediction, current_prediction
+):
+    if side == LONG:
+        if entry_price * (1 + entry_prediction) < current_price * (
+            1 + current_prediction
+        ):
+            return ((current_price * (1 + current_prediction)) / entry_price) - 1
+
+    if side == SHORT:
+        if entry_price * (1 + entry_prediction) > current_price * (
+            1 + current_prediction
+        ):
+            return ((current_price * (1 + current_prediction)) / entry_price) - 1
+
+    return entry_prediction
+
+
+@njit(cache=True)
+def run_backtest_kernel(
+    pricing,
+    predictions,
+    probabilities,
+    timestamps,
+    positive_entry_bins,
+    negative_entry_bins,
+    positive_probability_bins,
+    negative_probability_bins,
+    signal_set_ids,
+    exit_bins,
+    long_enabled,
+    short_enabled,
+    entry_ratio,
+    commission_entry,
+    commission_exit,
+    commission_spread,
+    min_holding_minutes,
+    max_holding_minutes,
+    compound_interest,
+    order_by_capital,
+    possible_in_debt,
+    exit_if_achieved,
+    achieve_ratio,
+    achieved_with_commission,
+    max_n_updated,
+    exit_threshold_auto,
+    adjust_prediction,
+):
+    """
+    Same state machine with BacktesterV1.run, over arrays of (time x asset).
+    N parameter combos advance together in one time loop, every parameter and state
+    has the combo on its leading axis. Signal bins are given as (set x asset),
+    and signal_set_ids maps each combo to its set, so each set is computed once a minute.
+    max_n_updated < 0 means None (skip updating positions).
+    Returns caches and capitals of (time x combo), trade returns with their minute and combo indices.
+    """
+    n_rows, n_assets = pricing.shape
+    n_sets = len(positive_entry_bins)
+    n_combos = len(signal_set_ids)
+
+    # Positions of each asset, only one position per asset can exist
+    sides = np.zeros((n_combos, n_assets), dtype=np.int64)
+    qtys = np.zeros((n_combos, n_assets))
+    entry_prices = np.zeros((n_combos, n_assets))
+    position_predictions = np.zeros((n_combos, n_assets))
+    entry_indices = np.zeros((n_combos, n_assets), dtype=np.int64)
+    n_updated = np.zeros((n_combos, n_assets), dtype=np.int64)
+
+    # Assets in order of entry, same with the order of positions in BacktesterV1
+    open_assets = np.zeros((n_combos, n_assets), dtype=np.int64)
+    n_opens = np.zeros(n_combos, dtype=np.int64)
+
+    caches = np.empty((n_rows, n_combos))
+    capitals = np.empty((n_rows, n_combos))
+    trade_returns = np.empty(1024)
+    trade_return_indices = np.empty(1024, dtype=np.int64)
+    trade_return_combos = np.empty(1024, dtype=np.int64)
+    n_trades = 0
+
+    positive_signals = np.zeros((n_sets, n_assets), dtype=np.bool_)
+    negative_signals = np.zeros((n_sets, n_assets), dtype=np.bool_)
+
+    combo_caches = np.ones(n_combos)
+    for idx in range(n_rows):
+        current_prices = pricing[idx]
+
+        # Set assets which has signals, once for each set of bins
+        for signal_set in range(n_sets):
+            for asset in range(n_assets):
+                positive_signals[signal_set, asset] = (
+                    predictions[idx, asset] >= positive_entry_bins[signal_set, asset]
+                ) and (
+                    probabilities[idx, asset]
+                    >= positive_probability_bins[signal_set, asset]
+                )
+                negative_signals[signal_set, asset] = (
+                    predictions[idx, asset] <= negative_entry_bins[signal_set, asset]
+                ) and (
+                    probabilities[idx, asset]
+                    >= negative_probability_bins[signal_set, asset]
+                )
+
+        for combo in range(n_combos):
+            cache = combo_caches[combo]
+            signal_set = signal_set_ids[combo]
+            n_open = n_opens[combo]
+
+            # Exit
+            n_kept = 0
+            for position_idx in range(n_open):
+                asset = open_assets[combo, position_idx]
+                side = sides[combo, asset]
+                current_price = current_prices[asset]
+
+                is_exited = False
+                achieved = False
+
+                # Handle achievement
+                if exit_if_achieved[combo]:
+                    achieved = check_if_achieved(
+                        side=side,
+                        entry_price=entry_prices[combo, asset],
+                        prediction=position_predictions[combo, asset],
+                        current_price=current_price,
+                        exit_bin=exit_bins[combo, asset],
+                        commission_entry=commission_entry[combo],
+                        commission_exit=commission_exit[combo],
+                        commission_spread=commission_spread[combo],
+                        achieve_ratio=achieve_ratio[combo],
+                        achieved_with_commission=achieved_with_commission[combo],
+                        exit_threshold_auto=exit_threshold_auto[combo],
+                    )
+                    is_exited = achieved
+
+                # Keep position if matched
+                is_kept = ((side == LONG) and positive_signals[signal_set, asset]) or (
+                    (side == SHORT) and negative_signals[signal_set, asset]
+                )
+
+                if (not is_exited) and (not is_kept):
+                    passed_minutes = (
+                        (timestamps[idx] - timestamps[entry_indices[combo, asset]])
+                        / 10 ** 9
+                    ) / 60
+
+                    # Handle min_holding_minutes, max_holding_minutes and exit signal
+                    if passed_minutes > min_holding_minutes[combo]:
+                        if passed_minutes >= max_holding_minutes[combo]:
+                            is_exited = True
+                        elif (side == LONG) and negative_signals[signal_set, asset]:
+                            is_exited = True
+                        elif (side == SHORT) and positive_signals[signal_set, asset]:
+                            is_exited = True
+
+                if not is_exited:
+                    open_assets[combo, n_kept] = asset
+                    n_kept += 1
+                    continue
+
+                # Exit order
+                entry_price = entry_prices[combo, asset]
+                qty = qtys[combo, asset]
+                if side == LONG:
+                    profit_without_commission = current_price * qty
+                else:
+                    profit_without_commission = entry_price * qty
+                    profit_without_commission += (
+                        (current_price - entry_price) * qty * -1
+                    )
+
+                exit_commission = commission_exit[combo]
+                if not achieved:
+                    exit_commission = (commission_exit[combo] * 2) + commission_spread[
+                        combo
+                    ]
+
+                profit = profit_without_commission - (
+                    profit_without_commission * exit_commission
+                )
+                cache = cache + profit
+
+                net_profit = profit - (entry_price * qty)
+
+                if n_trades == len(trade_returns):
+                    trade_returns = np.concatenate((trade_returns, np.empty(n_trades)))
+                    trade_return_indices = np.concatenate(
+                        (trade_return_indices, np.empty(n_trades, dtype=np.int64))
+                    )
+                    trade_return_combos = np.concatenate(
+                        (trade_return_combos, np.empty(n_trades, dtype=np.int64))
+                    )
+
+                trade_returns[n_trades] = net_profit / (entry_price * qty)
+                trade_return_indices[n_trades] = idx
+                trade_return_combos[n_trades] = combo
+                n_trades += 1
+
+                sides[combo, asset] = 0
+
+            n_open = n_kept
+
+            # Compute how much use cache
+            if not compound_interest[combo]:
+                cache_to_order = entry_ratio[combo]
+            elif order_by_capital[combo]:
+                # Entry with capital base
+                cache_to_order = nan_to_zero(
+                    compute_capital(
+                        cache=cache,
+                        current_prices=current_prices,
+                        open_assets=open_assets[combo],
+                        n_open=n_open,
+                        sides=sides[combo],
+                        qtys=qtys[combo],
+                        entry_prices=entry_prices[combo],
+                    )
+                    * entry_ratio[combo]
+                )
+            elif cache > 0:
+                cache_to_order = nan_to_zero(cache * entry_ratio[combo])
+            else:
+                cache_to_order = 0.0
+
+            commission_entry_cost = commission_entry[combo] + commission_spread[combo]
+
+            # Entry
+            for order_side in (LONG, SHORT):
+                if (order_side == LONG) and (not long_enabled[combo]):
+                    continue
+
+                if (order_side == SHORT) and (not short_enabled[combo]):
+                    continue
+
+                if cache_to_order == 0:
+                    continue
+
+                for asset in range(n_assets):
+                    if order_side == LONG:
+                        if not positive_signals[signal_set, asset]:
+                            continue
+                    else:
+                        if not negative_signals[signal_set, asset]:
+                            continue
+
+                    # if opposite position exists, we dont entry
+                    if sides[combo, asset] == -order_side:
+                        continue
+
+                    entry_price = current_prices[asset]
+                    prediction = predictions[idx, asset]
+                    qty = cache_to_order / entry_price
+                    cost = (entry_price * qty) + (
+                        (entry_price * qty) * commission_entry_cost
+                    )
+
+                    if sides[combo, asset] == order_side:
+                        # Skip when max_n_updated is None
+                        if max_n_updated[combo] < 0:
+                            continue
+
+                        # Update only prediction, and entry_at
+                        if n_updated[combo, asset] == max_n_updated[combo]:
+                            if adjust_prediction[combo]:
+                                adjusted_prediction = compute_adjusted_prediction(
+                                    side=order_side,
+                                    entry_price=entry_prices[combo, asset],
+                                    current_price=entry_price,
+                                    entry_prediction=position_predictions[combo, asset],
+                                    current_prediction=prediction,
+                                )
+                                position_predictions[combo, asset] = adjusted_prediction
+
+                            entry_indices[combo, asset] = idx
+                            continue
+
+                        if (not possible_in_debt[combo]) and (
+                            not ((cache - cost) >= 0)
+                        ):
+                            continue
+
+                        # Update entry_price, entry_at and qty
+                        exist_qty = qtys[combo, asset]
+                        entry_prices[combo, asset] = (
+                            (entry_prices[combo, asset] * exist_qty)
+                            + (entry_price * qty)
+                        ) / (exist_qty + qty)
+                        position_predictions[combo, asset] = (
+                            (position_predictions[combo, asset] * exist_qty)
+                            + (prediction * qty)
+                        ) / (exist_qty + qty)
+                        qtys[combo, asset] = exist_qty + qty
+                        entry_indices[combo, asset] = idx
+                        n_updated[combo, asset] += 1
+
+                        cache = cache - cost
+                        continue
+
+                    if (not possible_in_debt[combo]) and (not ((cache - cost) >= 0)):
+                        continue
+
+                    sides[combo, asset] = order_side
+                    qtys[combo, asset] = qty
+                    entry_prices[combo, asset] = entry_price
+                    position_predictions[combo, asset] = prediction
+                    entry_indices[combo, asset] = idx
+                    n_updated[combo, asset] = 0
+                    open_assets[combo, n_open] = asset
+                    n_open += 1
+
+                    cache = cache - cost
+
+            combo_caches[combo] = cache
+            n_opens[combo] = n_open
+
+            # To report
+            caches[idx, combo] = cache
+            capitals[idx, combo] = compute_capital(
+                cache=cache,
+                current_prices=current_prices,
+                open_assets=open_assets[combo],
+                n_open=n_open,
+                sides=sides[combo],
+                qtys=qtys[combo],
+                entry_prices=entry_prices[combo],
+            )
+
+    return (
+        caches,
+        capitals,
+        trade_returns[:n_trades],
+        trade_return_indices[:n_trades],
+        trade_return_combos[:n_trades],
+    )
@@ -1,3 +1,5 @@
+import os
+import numpy as np
 import pandas as pd
 
 
@@ -12,6 +14,47 @@ def load_parquet(path):
     return pd.read_parquet(path)
 
 
+def store_data_dict_as_arrays(data_dict, store_dir, columns=None, dtype=None):
+    """
+    Values are stored as .npy, only paths and labels are passed to other processes.
+    Stored in columns order and dtype which backtesters read, so workers do not copy.
+    """
+    meta_dict = {}
+    for key, data in data_dict.items():
+        if columns is not None:
+            data = data[columns]
+        if dtype is not None:
+            data = data.astype(dtype)
+
+        path = os.path.join(store_dir, f"{key}.npy")
+        np.save(path, np.ascontiguousarray(data.values))
+
+        meta_dict[key] = {"path": path, "index": data.index, "columns": data.columns}
+
+    return meta_dict
+
+
+def to_array(data, columns, dtype="float64"):
+    # Without copy, if data is already in columns order and dtype (e.g. shared memmap)
+    if isinstance(data, pd.DataFrame) and data.columns.equals(pd.Index(columns)):
+        return np.asarray(data.values, dtype=dtype)
+
+    return data[columns].values.astype(dtype)
+
+
+def load_data_dict_from_arrays(meta_dict):
+    # Memory-mapped, so processes share the same pages
+    return {
+        key: pd.DataFrame(
+            np.load(meta["path"], mmap_mode="r"),
+            index=meta["index"],
+            columns=meta["columns"],
+            copy=False,
+        )
+        for key, meta in meta_dict.items()
+    }
+
+
 class Position:
     def __init__(
         self,
@@ -23,8 +23,26 @@ CONFIG = {
     "scaler_type": "StandardScaler",
     "winsorize_threshold": 6,
     "query_min_start_dt": "2018-06-01",
+    "store_arrays": True,
 }
 OHLC = ["open", "high", "low", "close"]
+FEATURE_WINDOWS = [1320, 600, 240, 120]
+INNER_CHANGE_PAIRS = sorted(list(combinations(OHLC, 2)))
+
+
+def build_feature_names():
+    # Same order with columns of _build_feature_by_rawdata_row
+    feature_names = []
+    for window in FEATURE_WINDOWS:
+        feature_names += [key + f"_return({window})" for key in OHLC]
+        feature_names += [key + f"_madiv({window})" for key in OHLC]
+
+    feature_names += [key + "_return(1)" for key in OHLC]
+    feature_names += [
+        "_".join(column_pair) + "_change" for column_pair in INNER_CHANGE_PAIRS
+    ]
+
+    return feature_names
 
 
 @dataclass
@@ -174,14 +192,107 @@ class DatasetBuilder:
 
         return feature
 
-    def build_features(self, rawdata):
-        features = {}
-        for coin in tqdm(self.tradable_coins):
-            features[coin] = self._build_feature_by_rawdata_row(
-                rawdata_row=rawdata[coin]
+    def _build_features_by_rawdata(self, rawdata):
+        # Compute features of all coins at once.
+        # Arrays are laid out as (coin x OHLC x time) to operate on contiguous time.
+        rawdata = rawdata.sort_index()
+        n_rows = len(rawdata.index)
+        n_coins = len(self.tradable_coins)
+        feature_names = build_feature_names()
+
+        values = np.ascontiguousarray(
+            rawdata.reindex(
+                columns=pd.MultiIndex.from_product([self.tradable_coins, OHLC])
             )
+            .values.astype("float64")
+            .T.reshape(n_coins, len(OHLC), n_rows)
+        )
+
+        def _build_returns(window):
+            returns = np.full(values.shape, np.nan)
+            returns[:, :, window:] = values[:, :, window:] / values[:, :, :-window] - 1
+
+            return returns
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Rows are dropped by the return of the longest window
+            is_valid = ~np.isnan(_build_returns(max(FEATURE_WINDOWS))).any(axis=1)
+            rows_to_keep = np.flatnonzero(is_valid.any(axis=0))
+            is_valid = is_valid[:, rows_to_keep]
 
-        features = pd.concat(features, axis=1).sort_index()[self.tradable_coins]
+        # Slice is much faster than fancy indexing when rows are contiguous
+        if (len(rows_to_keep) != 0) and (
+            rows_to_keep[-1] - rows_to_keep[0] + 1 == len(rows_to_keep)
+        ):
+            rows_to_keep = slice(rows_to_keep[0], rows_to_keep[-1] + 1)
+
+        # Shift by the first valid value to keep precision of cumsum
+        is_nan = np.isnan(values)
+        offsets = np.nan_to_num(
+            np.take_along_axis(values, (~is_nan).argmax(axis=-1)[:, :, None], axis=-1)
+        )
+        cumsums = np.zeros(values.shape[:-1] + (n_rows + 1,))
+        cumsums[:, :, 1:] = np.cumsum(np.nan_to_num(values - offsets), axis=-1)
+        nan_counts = np.zeros(values.shape[:-1] + (n_rows + 1,), dtype=np.int64)
+        nan_counts[:, :, 1:] = np.cumsum(is_nan, axis=-1)
+        del is_nan
+
+        def _build_moving_averages(window):
+            moving_averages = np.full(values.shape, np.nan)
+            moving_averages[:, :, window - 1 :] = (
+                (cumsums[:, :, window:] - cumsums[:, :, :-window]) / window
+            ) + offsets
+            moving_averages[:, :, window - 1 :][
+                (nan_counts[:, :, window:] - nan_counts[:, :, :-window]) != 0
+            ] = np.nan
+
+            return moving_averages
+
+        features = np.empty((n_coins, len(feature_names), is_valid.shape[-1]))
+
+        def _set_group(group_idx, group):
+            # Each group is dropped if any of OHLC is nan
+            group = group[:, :, rows_to_keep]
+            features[:, group_idx * len(OHLC) : (group_idx + 1) * len(OHLC)] = np.where(
+                np.isnan(group).any(axis=1, keepdims=True), np.nan, group
+            )
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for idx, window in enumerate(FEATURE_WINDOWS):
+                _set_group(group_idx=idx * 2, group=_build_returns(window))
+                _set_group(group_idx=idx * 2 + 1, group=_build_moving_averages(window))
+            _set_group(group_idx=len(FEATURE_WINDOWS) * 2, group=_build_returns(1))
+
+            for idx, column_pair in enumerate(INNER_CHANGE_PAIRS):
+                features[:, len(OHLC) * (len(FEATURE_WINDOWS) * 2 + 1) + idx] = (
+                    values[:, OHLC.index(column_pair[-1]), rows_to_keep]
+                    / values[:, OHLC.index(column_pair[0]), rows_to_keep]
+                    - 1
+                )
+
+        for coin_idx in range(n_coins):
+            features[coin_idx][:, ~is_valid[coin_idx]] = np.nan
+
+        features = pd.DataFrame(
+            features.reshape(n_coins * len(feature_names), -1).T,
+            index=rawdata.index[rows_to_keep],
+            columns=pd.MultiIndex.from_product([self.tradable_coins, feature_names]),
+            copy=False,
+        )
+
+        return features
+
+    def build_features(self, rawdata, vectorized=True):
+        if vectorized is True:
+            features = self._build_features_by_rawdata(rawdata=rawdata)
+        else:
+            features = {}
+            for coin in tqdm(self.tradable_coins):
+                features[coin] = self._build_feature_by_rawdata_row(
+                    rawdata_row=rawdata[coin]
+                )
+
+            features = pd.concat(features, axis=1).sort_index()[self.tradable_coins]
 
         if self.feature_columns is None:
             self.feature_columns = features.columns
@@ -254,6 +365,43 @@ class DatasetBuilder:
 
         return labels
 
+    def store_arrays(self, features, labels, data_dir):
+        # Raw arrays to be memory-mapped by ArrayDataset: X (asset x feature x time)
+        assets = features.columns.remove_unused_levels().levels[0].tolist()
+        feature_names = features[assets[0]].columns.tolist()
+
+        X = np.lib.format.open_memmap(
+            os.path.join(data_dir, "X.npy"),
+            mode="w+",
+            dtype="float32",
+            shape=(len(assets), len(feature_names), len(features.index)),
+        )
+        for asset_idx, asset in enumerate(assets):
+            X[asset_idx] = features[asset][feature_names].values.T
+
+        X.flush()
+        del X
+
+        np.save(
+            os.path.join(data_dir, "Y.npy"),
+            labels.reindex(index=features.index, columns=assets).values.astype(
+                "float32"
+            ),
+        )
+        # datetime64 values are stored in UTC without tz, so keep tz in meta
+        np.save(os.path.join(data_dir, "index.npy"), features.index.values)
+        tz = features.index.tz
+
+        with open(os.path.join(data_dir, "meta.json"), "w") as f:
+            json.dump(
+                {
+                    "assets": assets,
+                    "feature_names": feature_names,
+                    "tz": str(tz) if tz is not None else None,
+                },
+                f,
+            )
+
     def store_artifacts(
         self,
         features,
@@ -264,6 +412,7 @@ class DatasetBuilder:
         train_ratio,
         params,
         data_store_dir,
+        store_arrays=False,
     ):
         # Make dirs
         train_data_store_dir = os.path.join(data_store_dir, "train")
@@ -297,6 +446,19 @@ class DatasetBuilder:
                 path=os.path.join(test_data_store_dir, file_name),
             )
 
+        if store_arrays is True:
+            self.store_arrays(
+                features=features.iloc[:boundary_index],
+                labels=labels.iloc[:boundary_index],
+                data_dir=train_data_store_dir,
+            )
+
+            self.store_arrays(
+                features=features.iloc[boundary_index:],
+                labels=labels.iloc[boundary_index:],
+                data_dir=test_data_store_dir,
+            )
+
         print(f"[+] Dataset is stored")
 
     def build(
@@ -308,6 +470,7 @@ class DatasetBuilder:
         scaler_type=CONFIG["scaler_type"],
         winsorize_threshold=CONFIG["winsorize_threshold"],
         query_min_start_dt=CONFIG["query_min_start_dt"],
+        store_arrays=CONFIG["store_arrays"],
     ):
         assert scaler_type in ("RobustScaler", "StandardScaler")
         pandarallel.initialize()
@@ -368,6 +531,7 @@ class DatasetBuilder:
             train_ratio=train_ratio,
             params=params,
             data_store_dir=data_store_dir,
+            store_arrays=store_arrays,
         )
 
 
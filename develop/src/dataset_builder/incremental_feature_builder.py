@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+from collections import deque
+from typing import Optional, List
+from dataset_builder.build_dataset import (
+    OHLC,
+    FEATURE_WINDOWS,
+    INNER_CHANGE_PAIRS,
+    build_feature_names,
+)
+
+
+class IncrementalFeatureBuilder:
+    """
+    Build the same features with DatasetBuilder._build_feature_by_rawdata_row,
+    but candle by candle. Rolling sums are kept per coin, OHLC and window,
+    so the cost of each update does not depend on the longest window.
+
+    Functions:
+        update(rawdata: pd.DataFrame): push new candles, (timestamp x (coin, OHLC))
+            a candle which has same timestamp with the last one replaces it.
+        build_features(): features of last n_history candles
+    """
+
+    def __init__(
+        self,
+        tradable_coins: List,
+        feature_columns: Optional[List] = None,
+        n_history: int = 1,
+        resync_interval: Optional[int] = None,
+    ):
+        self.tradable_coins = list(tradable_coins)
+        self.feature_columns = feature_columns
+        self.n_history = n_history
+
+        self.feature_names = build_feature_names()
+        self.columns = pd.MultiIndex.from_product(
+            [self.tradable_coins, self.feature_names]
+        )
+        self.rawdata_columns = pd.MultiIndex.from_product([self.tradable_coins, OHLC])
+
+        # Keep one more candle to compute return of the longest window
+        self.buffer_size = max(FEATURE_WINDOWS) + 1
+
+        # Recompute rolling sums from buffer periodically to prevent float drift
+        self.resync_interval = resync_interval
+        if self.resync_interval is None:
+            self.resync_interval = max(FEATURE_WINDOWS)
+
+        self.inner_change_indices = (
+            [OHLC.index(column_pair[0]) for column_pair in INNER_CHANGE_PAIRS],
+            [OHLC.index(column_pair[-1]) for column_pair in INNER_CHANGE_PAIRS],
+        )
+
+        self.reset()
+
+    def reset(self):
+        n_coins = len(self.tradable_coins)
+
+        self.n_rows = 0
+        self.last_timestamp = None
+        self.rawdata_buffer = np.full((self.buffer_size, n_coins, len(OHLC)), np.nan)
+        self.rolling_sums = np.zeros((len(FEATURE_WINDOWS), n_coins, len(OHLC)))
+        self.rolling_nan_counts = np.zeros(
+            (len(FEATURE_WINDOWS), n_coins, len(OHLC)), dtype=np.int64
+        )
+
+        self.historical_timestamps = deque(maxlen=self.n_history)
+        self.historical_features = deque(maxlen=self.n_history)
+
+    def _get_row(self, row_idx):
+        return self.rawdata_buffer[row_idx % self.buffer_size]
+
+    def _add_to_window(self, window_idx, values):
+        is_nan = np.isnan(values)
+        self.rolling_sums[window_idx] += np.where(is_nan, 0, values)
+        self.rolling_nan_counts[window_idx] += is_nan
+
+    def _remove_from_window(self, window_idx, values):
+        is_nan = np.isnan(values)
+        self.rolling_sums[window_idx] -= np.where(is_nan, 0, values)
+        self.rolling_nan_counts[window_idx] -= is_nan
+
+    def _resync_rolling_sums(self):
+        last_row_idx = self.n_rows - 1
+        for window_idx, window in enumerate(FEATURE_WINDOWS):
+            row_indices = np.arange(max(0, last_row_idx - window + 1), last_row_idx + 1)
+            values = self.rawdata_buffer[row_indices % self.buffer_size]
+
+            self.rolling_sums[window_idx] = np.nansum(values, axis=0)
+            self.rolling_nan_counts[window_idx] = np.isnan(values).sum(axis=0)
+
+    def _append_row(self, values):
+        row_idx = self.n_rows
+        for window_idx, window in enumerate(FEATURE_WINDOWS):
+            if row_idx - window >= 0:
+                self._remove_from_window(
+                    window_idx=window_idx, values=self._get_row(row_idx - window)
+                )
+
+            self._add_to_window(window_idx=window_idx, values=values)
+
+        self.rawdata_buffer[row_idx % self.buffer_size] = values
+        self.n_rows += 1
+
+        if self.n_rows % self.resync_interval == 0:
+            self._resync_rolling_sums()
+
+    def _replace_last_row(self, values):
+        # The last candle is included in every window
+        last_values = self._get_row(self.n_rows - 1).copy()
+        for window_idx in range(len(FEATURE_WINDOWS)):
+            self._remove_from_window(window_idx=window_idx, values=last_values)
+            self._add_to_window(window_idx=window_idx, values=values)
+
+        self.rawdata_buffer[(self.n_rows - 1) % self.buffer_size] = values
+
+    def _compute_returns(self, values, row_idx, window):
+        if row_idx - window < 0:
+            return np.full(values.shape, np.nan)
+
+        return values / self._get_row(row_idx - window) - 1
+
+    def _compute_last_feature(self):
+        row_idx = self.n_rows - 1
+        values = self._get_row(row_idx)
+
+        features = []
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for window_idx, window in enumerate(FEATURE_WINDOWS):
+                features.append(
+                    self._compute_returns(values=values, row_idx=row_idx, window=window)
+                )
+
+                moving_average = self.rolling_sums[window_idx] / window
+                moving_average[
+                    (self.rolling_nan_counts[window_idx] != 0) | (row_idx + 1 < window)
+                ] = np.nan
+                features.append(moving_average)
+
+            features.append(
+                self._compute_returns(values=values, row_idx=row_idx, window=1)
+            )
+            features.append(
+                values[:, self.inner_change_indices[1]]
+                / values[:, self.inner_change_indices[0]]
+                - 1
+            )
+
+        # Each group of returns and moving averages is dropped if any of OHLC is nan
+        for idx, group in enumerate(features[:-1]):
+            features[idx] = np.where(
+                np.isnan(group).any(axis=1, keepdims=True), np.nan, group
+            )
+
+        features = np.concatenate(features, axis=1)
+
+        # Rows are dropped by the return of the longest window
+        features[np.isnan(features[:, : len(OHLC)]).any(axis=1)] = np.nan
+
+        return features
+
+    def update(self, rawdata: pd.DataFrame):
+        rawdata = rawdata.sort_index().reindex(columns=self.rawdata_columns)
+        values = rawdata.values.astype("float64").reshape(
+            len(rawdata.index), len(self.tradable_coins), len(OHLC)
+        )
+
+        for timestamp, row_values in zip(rawdata.index, values):
+            if (self.last_timestamp is not None) and (timestamp == self.last_timestamp):
+                self._replace_last_row(values=row_values)
+                self.historical_features.pop()
+                self.historical_timestamps.pop()
+            else:
+                assert (self.last_timestamp is None) or (
+                    timestamp > self.last_timestamp
+                )
+                self._append_row(values=row_values)
+
+            self.historical_features.append(self._compute_last_feature())
+            self.historical_timestamps.append(timestamp)
+            self.last_timestamp = timestamp
+
+    def build_features(self):
+        features = pd.DataFrame(
+            np.stack(self.historical_features, axis=0).reshape(
+                len(self.historical_timestamps), -1
+            ),
+            index=pd.Index(self.historical_timestamps),
+            columns=self.columns,
+        ).dropna(how="all")
+
+        if self.feature_columns is None:
+            return features
+
+        return features[self.feature_columns]
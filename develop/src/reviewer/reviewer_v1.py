@@ -4,7 +4,10 @@ from joblib import Parallel, delayed
 from IPython.display import display, display_markdown
 from tqdm import tqdm
 import backtester
+from backtester.utils import store_data_dict_as_arrays, load_data_dict_from_arrays
 import os
+import shutil
+import tempfile
 import pandas as pd
 from glob import glob
 import matplotlib.pyplot as plt
@@ -16,6 +19,26 @@ from tabulate import tabulate
 import fancytable as ft
 
 
+def run_backtester(backtester, historical_data_meta_dict):
+    # Attach to historical data which is loaded once by reviewer
+    backtester.run(
+        display=False,
+        historical_data_dict=load_data_dict_from_arrays(
+            meta_dict=historical_data_meta_dict
+        ),
+    )
+
+
+def run_backtester_batch(backtesters, historical_data_meta_dict):
+    # Advance a chunk of grid in one time loop, on the shared historical data
+    backtester.run_batch(
+        backtesters=backtesters,
+        historical_data_dict=load_data_dict_from_arrays(
+            meta_dict=historical_data_meta_dict
+        ),
+    )
+
+
 @dataclass
 class ReviewerV1:
     dataset_dir: str = to_abs_path(__file__, "../../storage/dataset/dataset/v001/")
@@ -26,8 +49,12 @@ class ReviewerV1:
     exec_start: int = 0
     exec_end: int = None
     n_jobs: int = 16
+    batch_size: int = 1
 
     def __post_init__(self):
+        if self.batch_size > 1:
+            assert self.backtester_type == "BacktesterV1"
+
         if isinstance(self.grid_params, str):
             self.grid_params = getattr(paramset, self.grid_params)
 
@@ -320,9 +347,41 @@ class ReviewerV1:
 
         print(f"[+] Found backtests to start: {len(self.backtesters)}")
 
-        Parallel(n_jobs=self.n_jobs, verbose=1)(
-            [delayed(backtester.run)(display=False) for backtester in self.backtesters]
-        )
+        if len(self.backtesters) != 0:
+            # Load historical data once, and share it with workers through memmap
+            store_dir = tempfile.mkdtemp(
+                dir="/dev/shm" if os.path.isdir("/dev/shm") else None
+            )
+            try:
+                historical_data_dict = self.backtesters[0].load_historical_data_dict()
+                historical_data_meta_dict = store_data_dict_as_arrays(
+                    data_dict=historical_data_dict,
+                    store_dir=store_dir,
+                    columns=historical_data_dict["predictions"].columns,
+                    dtype="float64",
+                )
+                del historical_data_dict
+
+                if self.batch_size > 1:
+                    jobs = [
+                        delayed(run_backtester_batch)(
+                            backtesters=self.backtesters[idx : idx + self.batch_size],
+                            historical_data_meta_dict=historical_data_meta_dict,
+                        )
+                        for idx in range(0, len(self.backtesters), self.batch_size)
+                    ]
+                else:
+                    jobs = [
+                        delayed(run_backtester)(
+                            backtester=backtester,
+                            historical_data_meta_dict=historical_data_meta_dict,
+                        )
+                        for backtester in self.backtesters
+                    ]
+
+                Parallel(n_jobs=self.n_jobs, verbose=1)(jobs)
+            finally:
+                shutil.rmtree(store_dir)
 
         self.display(in_shell=in_shell)
 
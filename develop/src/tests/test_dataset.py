@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+from common_utils_dev import to_parquet
+from dataset_builder.build_dataset import DatasetBuilder
+from trainer.datasets.dataset import ArrayDataset, FILENAME_TEMPLATE
+
+
+ASSETS = ["ADA-USDT", "BTC-USDT", "ETH-USDT"]
+FEATURE_NAMES = ["open_return(1)", "close_return(1)"]
+LOOKBACK_WINDOW = 4
+
+
+def build_features_and_labels(n_rows=16):
+    rng = np.random.default_rng(0)
+    index = pd.date_range("2021-01-01", periods=n_rows, freq="min", tz="UTC")
+
+    features = pd.DataFrame(
+        rng.normal(size=(n_rows, len(ASSETS) * len(FEATURE_NAMES))).astype("float32"),
+        index=index,
+        columns=pd.MultiIndex.from_product([ASSETS, FEATURE_NAMES]),
+    )
+    labels = pd.DataFrame(
+        rng.normal(size=(n_rows, len(ASSETS))).astype("float32"),
+        index=index,
+        columns=ASSETS,
+    )
+
+    return features, labels
+
+
+def store_parquets(features, labels, data_dir):
+    to_parquet(df=features, path=str(data_dir / FILENAME_TEMPLATE["X"]))
+    to_parquet(df=labels, path=str(data_dir / FILENAME_TEMPLATE["Y"]))
+
+
+def build_dataset(data_dir, base_feature_assets):
+    return ArrayDataset(
+        data_dir=str(data_dir),
+        transforms={},
+        base_feature_assets=base_feature_assets,
+        asset_to_id={asset: idx for idx, asset in enumerate(ASSETS)},
+        lookback_window=LOOKBACK_WINDOW,
+    )
+
+
+def test_missing_base_feature_asset(tmp_path):
+    features, labels = build_features_and_labels()
+    store_parquets(features=features, labels=labels, data_dir=tmp_path)
+
+    build_dataset(data_dir=tmp_path, base_feature_assets=["BTC-USDT"])
+    with pytest.raises(KeyError, match="DOGE-USDT"):
+        build_dataset(data_dir=tmp_path, base_feature_assets=["DOGE-USDT"])
+
+
+def test_array_index_equals_parquet_index(tmp_path):
+    features, labels = build_features_and_labels()
+    parquet_dir = tmp_path / "parquet"
+    array_dir = tmp_path / "array"
+    parquet_dir.mkdir()
+    array_dir.mkdir()
+
+    store_parquets(features=features, labels=labels, data_dir=parquet_dir)
+    DatasetBuilder().store_arrays(
+        features=features, labels=labels, data_dir=str(array_dir)
+    )
+
+    parquet_dataset = build_dataset(data_dir=parquet_dir, base_feature_assets=ASSETS)
+    array_dataset = build_dataset(data_dir=array_dir, base_feature_assets=ASSETS)
+
+    assert array_dataset.index.levels[0].tz is not None
+    assert array_dataset.index.equals(parquet_dataset.index)
@@ -0,0 +1,68 @@
+import os
+import json
+import joblib
+import numpy as np
+import pandas as pd
+import torch
+from sklearn.preprocessing import StandardScaler
+from trainer.models.backbones import BackboneV1
+from trainer.models.predictor_v1 import PredictorV1
+
+
+ASSETS = ["BTC-USDT", "ETH-USDT", "XRP-USDT"]
+MODEL_PARAMS = {
+    "in_channels": 6,
+    "n_blocks": 2,
+    "n_block_layers": 2,
+    "dropout": 0.5,
+}
+
+
+def build_exp_dir(exp_dir):
+    os.makedirs(os.path.join(exp_dir, "check_point"))
+
+    with open(os.path.join(exp_dir, "dataset_params.json"), "w") as f:
+        json.dump(
+            {
+                "tradable_coins": ASSETS,
+                "labels_columns": ASSETS,
+                "winsorize_threshold": 6,
+            },
+            f,
+        )
+
+    rng = np.random.default_rng(0)
+    label_scaler = StandardScaler().fit(
+        pd.DataFrame(rng.normal(size=(100, len(ASSETS))), columns=ASSETS)
+    )
+    joblib.dump(label_scaler, os.path.join(exp_dir, "label_scaler.pkl"))
+
+    torch.manual_seed(0)
+    model = BackboneV1(n_assets=len(ASSETS), **MODEL_PARAMS)
+    torch.save(
+        model.state_dict(), os.path.join(exp_dir, "check_point", "checkpoint-1.ckpt")
+    )
+
+
+def test_predict_array_is_deterministic(tmp_path):
+    exp_dir = str(tmp_path)
+    build_exp_dir(exp_dir=exp_dir)
+
+    predictor = PredictorV1(
+        exp_dir=exp_dir,
+        m_config={"lookback_window": 16, "model_params": MODEL_PARAMS},
+        device="cpu",
+        mode="predict",
+    )
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(len(ASSETS), MODEL_PARAMS["in_channels"], 16)).astype(
+        "float32"
+    )
+    id = np.arange(len(ASSETS))
+
+    predictions, probabilities = predictor.predict_array(X=X, id=id)
+    predictions_, probabilities_ = predictor.predict_array(X=X, id=id)
+
+    np.testing.assert_array_equal(predictions, predictions_)
+    np.testing.assert_array_equal(probabilities, probabilities_)
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import torch
+from types import SimpleNamespace
+from trainer.models.backbones import BackboneV1
+from trainer.models.stack_predictor_v1 import StackPredictorV1
+
+
+N_ASSETS = 4
+IN_CHANNELS = 6
+LOOKBACK_WINDOW = 16
+LOCAL_LOOKBACK_WINDOW = 5
+
+
+def build_predictor():
+    # Only parts used by feature extraction, without experiment files
+    torch.manual_seed(0)
+    feature_extractor = BackboneV1(
+        in_channels=IN_CHANNELS, n_assets=N_ASSETS, n_blocks=2, n_block_layers=2
+    ).eval()
+
+    predictor = StackPredictorV1.__new__(StackPredictorV1)
+    predictor.device = "cpu"
+    predictor.model_config = {
+        "local_lookback_window": LOCAL_LOOKBACK_WINDOW,
+        "model_params": {"n_assets": N_ASSETS},
+    }
+    predictor.feature_extractor = SimpleNamespace(model=feature_extractor)
+    predictor.feature_extractor_params = {
+        "model_config": {"lookback_window": LOOKBACK_WINDOW}
+    }
+    predictor.features_buffer = None
+    predictor.features_buffer_timestamps = None
+
+    return predictor
+
+
+def test_extract_features_incrementally():
+    predictor = build_predictor()
+    rng = np.random.default_rng(0)
+    X = torch.from_numpy(
+        rng.standard_normal((N_ASSETS, IN_CHANNELS, 100)).astype("float32")
+    )
+    start_on = pd.Timestamp("2021-01-01 00:00", tz="UTC")
+    window = LOOKBACK_WINDOW + LOCAL_LOOKBACK_WINDOW - 1
+
+    # Consecutive, same minute, subset of assets, back to all and a gap
+    for minute, ids in [
+        (30, [0, 1, 2, 3]),
+        (31, [0, 1, 2, 3]),
+        (31, [0, 1, 2, 3]),
+        (32, [0, 1]),
+        (33, [0, 1]),
+        (34, [0, 1, 2, 3]),
+        (35, [2, 3, 0, 1]),
+        (36, [3]),
+        (40, [0, 1, 2, 3]),
+        (41, [0, 1, 2, 3]),
+    ]:
+        if minute == 31:
+            # Last candle is changed in the same minute
+            X[:, :, minute] += torch.rand(1)
+
+        ids = torch.tensor(ids)
+        data_dict = {"X": X[ids, :, minute - window + 1 : minute + 1], "ID": ids}
+
+        expected = predictor._extract_features(data_dict=data_dict)
+        features = predictor._extract_features_incrementally(
+            data_dict=data_dict, timestamp=start_on + pd.Timedelta(minutes=minute)
+        )
+
+        for expected_, features_ in zip(expected, features):
+            assert torch.allclose(expected_, features_, atol=1e-6)
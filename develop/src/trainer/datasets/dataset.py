@@ -1,6 +1,7 @@
 from torch.utils.data import Dataset as _Dataset
 from typing import Dict, List, Callable
 import os
+import json
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
@@ -11,6 +12,12 @@ FILENAME_TEMPLATE = {
     "X": "X.parquet.zstd",
     "Y": "Y.parquet.zstd",
 }
+ARRAY_FILENAME_TEMPLATE = {
+    "X": "X.npy",
+    "Y": "Y.npy",
+    "index": "index.npy",
+    "meta": "meta.json",
+}
 
 
 def build_X_and_BX(features, base_feature_assets):
@@ -110,3 +117,232 @@ class Dataset(_Dataset):
         del concat_df
 
         return data_dict
+
+
+class ArrayDataset(_Dataset):
+    """
+    Same samples with Dataset, but X and BX are converted once into contiguous
+    float32 arrays (asset x feature x time), and each sample is a slice of them.
+    If arrays stored by DatasetBuilder exist, they are memory-mapped instead,
+    so data_loader workers share pages with each other.
+    """
+
+    def __init__(
+        self,
+        data_dir: str,
+        transforms: Dict[str, Callable],
+        base_feature_assets: List[str],
+        asset_to_id: Dict[str, int],
+        lookback_window: int = 120,
+    ):
+        print("[+] Start to build dataset")
+        self.data_caches = {}
+
+        # Build inputs
+        if os.path.exists(os.path.join(data_dir, ARRAY_FILENAME_TEMPLATE["meta"])):
+            X, Y, timestamps, assets = self._load_arrays(data_dir=data_dir)
+        else:
+            X, Y, timestamps, assets = self._load_parquets(data_dir=data_dir)
+
+        self.data_caches["X"] = X
+
+        # -1 of get_indexer would silently pick the last asset
+        base_feature_asset_indices = assets.get_indexer(base_feature_assets)
+        if (base_feature_asset_indices == -1).any():
+            missing_assets = [
+                base_feature_asset
+                for base_feature_asset, idx in zip(
+                    base_feature_assets, base_feature_asset_indices
+                )
+                if idx == -1
+            ]
+            raise KeyError(f"{missing_assets} not in assets of dataset")
+
+        self.data_caches["BX"] = X[base_feature_asset_indices].reshape(
+            -1, len(timestamps)
+        )
+
+        # Build index of (row, asset) which has enough valid rows to look back
+        rows = []
+        asset_indices = []
+        for asset_idx in tqdm(range(len(assets))):
+            is_valid = ~np.isnan(X[asset_idx]).any(axis=0)
+            asset_rows = np.flatnonzero(is_valid)[lookback_window - 1 :]
+            rows.append(asset_rows)
+            asset_indices.append(np.full(len(asset_rows), asset_idx))
+
+        self.rows = np.concatenate(rows)
+        self.asset_indices = np.concatenate(asset_indices)
+        self.ids = np.array([asset_to_id[asset] for asset in assets])[
+            self.asset_indices
+        ]
+        self.index = pd.MultiIndex.from_arrays(
+            [timestamps[self.rows], assets[self.asset_indices]]
+        )
+
+        # Build labels
+        self.data_caches["Y"] = np.asarray(
+            Y[self.rows, self.asset_indices], dtype="float32"
+        )
+        del Y
+
+        self.transforms = transforms
+        self.n_data = len(self.index)
+        self.lookback_window = lookback_window
+        self.asset_to_id = asset_to_id
+        self.extracted_features = None
+
+        gc.collect()
+        print("[+] built dataset")
+
+    def _load_arrays(self, data_dir):
+        with open(os.path.join(data_dir, ARRAY_FILENAME_TEMPLATE["meta"]), "r") as f:
+            meta = json.load(f)
+
+        X = np.load(os.path.join(data_dir, ARRAY_FILENAME_TEMPLATE["X"]), mmap_mode="r")
+        Y = np.load(os.path.join(data_dir, ARRAY_FILENAME_TEMPLATE["Y"]), mmap_mode="r")
+        timestamps = pd.DatetimeIndex(
+            np.load(os.path.join(data_dir, ARRAY_FILENAME_TEMPLATE["index"]))
+        )
+
+        # Stored values are UTC. Arrays stored before tz was kept in meta come
+        # from UTC rawdata.
+        tz = meta.get("tz", "UTC")
+        if tz is not None:
+            timestamps = timestamps.tz_localize("UTC").tz_convert(tz)
+
+        assets = pd.Index(meta["assets"])
+
+        assert X.shape == (len(assets), len(meta["feature_names"]), len(timestamps))
+        assert Y.shape == (len(timestamps), len(assets))
+
+        return X, Y, timestamps, assets
+
+    def _load_parquets(self, data_dir):
+        features = pd.read_parquet(
+            os.path.join(data_dir, FILENAME_TEMPLATE["X"]), engine="pyarrow"
+        )
+        assets = features.columns.levels[0]
+        feature_names = features[assets[0]].columns
+        timestamps = features.index
+
+        X = np.ascontiguousarray(
+            features.reindex(
+                columns=pd.MultiIndex.from_product([assets, feature_names])
+            )
+            .values.astype("float32")
+            .T.reshape(len(assets), len(feature_names), len(timestamps))
+        )
+        del features
+        gc.collect()
+
+        Y = (
+            pd.read_parquet(
+                os.path.join(data_dir, FILENAME_TEMPLATE["Y"]), engine="pyarrow",
+            )
+            .reindex(index=timestamps, columns=assets)
+            .values
+        )
+
+        return X, Y, timestamps, assets
+
+    def __len__(self):
+        return self.n_data
+
+    def set_extracted_features(self, extracted_features, window):
+        """
+        Attach outputs of a frozen feature extractor, (asset x feature x time).
+        Then samples have EF, the outputs of their last window rows (feature x window).
+        """
+        assert extracted_features.shape[0] == self.data_caches["X"].shape[0]
+        assert extracted_features.shape[-1] == self.data_caches["X"].shape[-1]
+        self.extracted_features = extracted_features
+        self.extracted_features_window = window
+
+    def gather_windows(self, rows, asset_indices, lookback_window):
+        # Windows ending at rows of assets, from strided views
+        starts = rows - (lookback_window - 1)
+
+        windowed_BX = np.lib.stride_tricks.sliding_window_view(
+            self.data_caches["BX"], lookback_window, axis=-1
+        )
+        windowed_X = np.lib.stride_tricks.sliding_window_view(
+            self.data_caches["X"], lookback_window, axis=-1
+        )
+
+        # Concat with BX: (batch, channel, lookback_window)
+        return np.concatenate(
+            [
+                windowed_BX[:, starts].transpose(1, 0, 2),
+                windowed_X[asset_indices, :, starts],
+            ],
+            axis=1,
+        )
+
+    def _gather_extracted_features(self, indices):
+        windowed_EF = np.lib.stride_tricks.sliding_window_view(
+            self.extracted_features, self.extracted_features_window, axis=-1
+        )
+
+        return windowed_EF[
+            self.asset_indices[indices],
+            :,
+            self.rows[indices] - (self.extracted_features_window - 1),
+        ]
+
+    def get_batch(self, indices):
+        # Gather all windows of the batch at once
+        indices = np.asarray(indices)
+        data_dict = {
+            "X": self.gather_windows(
+                rows=self.rows[indices],
+                asset_indices=self.asset_indices[indices],
+                lookback_window=self.lookback_window,
+            ),
+            "Y": self.data_caches["Y"][indices],
+            "ID": self.ids[indices],
+        }
+
+        if self.extracted_features is not None:
+            data_dict["EF"] = self._gather_extracted_features(indices=indices)
+
+        # transform
+        for data_type, transform in self.transforms.items():
+            data_dict[data_type] = transform(data_dict[data_type])
+
+        return data_dict
+
+    def __getitem__(self, idx):
+        # A list of indices is given by BatchSampler
+        if isinstance(idx, (list, np.ndarray)):
+            return self.get_batch(idx)
+
+        # astype -> Y: int, else: float32
+        data_dict = {}
+
+        window = slice(self.rows[idx] - (self.lookback_window - 1), self.rows[idx] + 1)
+
+        # Concat with BX
+        data_dict["X"] = np.concatenate(
+            [
+                self.data_caches["BX"][:, window],
+                self.data_caches["X"][self.asset_indices[idx], :, window],
+            ],
+            axis=0,
+        )
+
+        data_dict["Y"] = self.data_caches["Y"][idx]
+
+        data_dict["ID"] = self.ids[idx]
+
+        if self.extracted_features is not None:
+            data_dict["EF"] = self._gather_extracted_features(indices=idx)
+
+        # transform
+        for data_type, transform in self.transforms.items():
+            data_dict[data_type] = transform(data_dict[data_type])
+
+        return data_dict
+
+
+DATASETS = {"Dataset": Dataset, "ArrayDataset": ArrayDataset}
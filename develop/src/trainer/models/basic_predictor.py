@@ -14,8 +14,13 @@ import torch.nn as nn
 from common_utils_dev import load_text, load_json, to_abs_path, get_parent_dir
 from .utils import save_model, load_model, weights_init
 from .criterions import CRITERIONS
-from ..datasets.dataset import Dataset
-from torch.utils.data import DataLoader
+from ..datasets.dataset import DATASETS
+from torch.utils.data import (
+    DataLoader,
+    BatchSampler,
+    RandomSampler,
+    SequentialSampler,
+)
 from trainer.models import backbones
 
 COMMON_CONFIG = {
@@ -31,6 +36,8 @@ DATA_CONFIG = {
     "checkpoint_dir": "./check_point",
     "generate_output_dir": "./generated_output",
     "base_feature_assets": ["BTC-USDT"],
+    "dataset_type": "ArrayDataset",
+    "batch_sampling": True,
 }
 
 MODEL_CONFIG = {
@@ -218,6 +225,23 @@ class BasicPredictor:
     def _build_transfroms(self):
         return {}
 
+    def _build_data_loader(self, dataset, shuffle, base_data_loader_params):
+        if not self.data_config["batch_sampling"]:
+            return DataLoader(dataset=dataset, shuffle=shuffle, **base_data_loader_params)
+
+        # Sample indices of a whole batch, then the dataset gathers the batch at once
+        assert hasattr(dataset, "get_batch")
+        base_data_loader_params = copy(base_data_loader_params)
+        sampler = BatchSampler(
+            RandomSampler(dataset) if shuffle is True else SequentialSampler(dataset),
+            batch_size=base_data_loader_params.pop("batch_size"),
+            drop_last=False,
+        )
+
+        return DataLoader(
+            dataset=dataset, sampler=sampler, batch_size=None, **base_data_loader_params
+        )
+
     def _build_data_loaders(self, mode):
         assert mode in ("train", "test")
         transforms = self._build_transfroms()
@@ -237,6 +261,7 @@ class BasicPredictor:
         }
 
         # Build dataset & data_loader
+        Dataset = DATASETS[self.data_config["dataset_type"]]
         test_dataset = Dataset(data_dir=self.test_data_dir, **base_dataset_params)
 
         train_data_loader = None
@@ -245,17 +270,23 @@ class BasicPredictor:
             train_dataset = Dataset(data_dir=self.data_dir, **base_dataset_params)
 
             # Define data_loader
-            train_data_loader = DataLoader(
-                dataset=train_dataset, shuffle=True, **base_data_loader_params
+            train_data_loader = self._build_data_loader(
+                dataset=train_dataset,
+                shuffle=True,
+                base_data_loader_params=base_data_loader_params,
             )
 
-            test_data_loader = DataLoader(
-                dataset=test_dataset, shuffle=True, **base_data_loader_params
+            test_data_loader = self._build_data_loader(
+                dataset=test_dataset,
+                shuffle=True,
+                base_data_loader_params=base_data_loader_params,
             )
 
         if mode == "test":
-            test_data_loader = DataLoader(
-                dataset=test_dataset, shuffle=False, **base_data_loader_params
+            test_data_loader = self._build_data_loader(
+                dataset=test_dataset,
+                shuffle=False,
+                base_data_loader_params=base_data_loader_params,
             )
 
         return train_data_loader, test_data_loader
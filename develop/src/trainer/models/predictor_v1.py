@@ -6,8 +6,10 @@ import torch.nn as nn
 import torch.nn.functional as F
 from typing import Union, Optional, List, Dict
 from tqdm import tqdm
+from itertools import islice
+from torch.utils.data import DataLoader, BatchSampler, RandomSampler
 from .basic_predictor import BasicPredictor
-from .utils import inverse_preprocess_data
+from .utils import inverse_preprocess_data, quantize_model
 from common_utils_dev import to_parquet, to_abs_path
 
 COMMON_CONFIG = {
@@ -22,6 +24,8 @@ DATA_CONFIG = {
     "checkpoint_dir": "./check_point",
     "generate_output_dir": "./generated_output",
     "base_feature_assets": ["BTC-USDT"],
+    "dataset_type": "ArrayDataset",
+    "batch_sampling": True,
 }
 
 MODEL_CONFIG = {
@@ -57,6 +61,8 @@ class PredictorV1(BasicPredictor):
         train(): train the model with train_data
         generate(save_dir: str): generate predictions & labels with test_data
         predict(X: torch.Tensor): gemerate prediction with given data
+        predict_array(X: np.ndarray, id: np.ndarray): lean predict for live inference
+        export_model(quantization: str): freeze the model into TorchScript for CPU inference
     """
 
     def __init__(
@@ -87,6 +93,38 @@ class PredictorV1(BasicPredictor):
             default_m_config=default_m_config,
         )
 
+        if mode == "predict":
+            # predict_array runs the model as it is, so dropout is off from here
+            self.model.eval()
+            self._build_label_inverter()
+
+    def _build_label_inverter(self):
+        # Label scaler is affine per column, so inversion is x * slope + offset by id
+        labels_columns = self.dataset_params["labels_columns"]
+        offset = self.label_scaler.inverse_transform(
+            np.zeros((1, len(labels_columns)))
+        )[0]
+        slope = (
+            self.label_scaler.inverse_transform(np.ones((1, len(labels_columns))))[0]
+            - offset
+        )
+
+        # asset_to_id is ordered by id
+        label_indices = [
+            labels_columns.index(asset) for asset in self.asset_to_id.keys()
+        ]
+        self.label_slope = (
+            slope[label_indices] * self.dataset_params["winsorize_threshold"]
+        ).astype("float32")
+        self.label_offset = offset[label_indices].astype("float32")
+
+    def _build_exported_model_path(self, quantization=None):
+        postfix = "" if quantization is None else f"-{quantization}"
+        return os.path.join(
+            self.data_config["checkpoint_dir"],
+            f"exported-{self.last_epoch}{postfix}.pt",
+        )
+
     def _invert_to_prediction(self, pred_abs_factor, pred_sign_factor):
         multiply = ((pred_sign_factor >= 0.5) * 1.0) + ((pred_sign_factor < 0.5) * -1.0)
         return pred_abs_factor * multiply
@@ -319,6 +357,155 @@ class PredictorV1(BasicPredictor):
 
         return {"predictions": predictions, "probabilities": probabilities}
 
+    def predict_array(self, X: np.ndarray, id: np.ndarray):
+        """
+        Predict without pandas, predictions and probabilities are ordered as id.
+        """
+        assert self.mode in ("predict")
+        id = np.asarray(id, dtype=np.int64)
+
+        with torch.inference_mode():
+            pred_abs_factor, pred_sign_factor = self.model(
+                x=torch.from_numpy(np.asarray(X, dtype=np.float32)).to(self.device),
+                id=torch.from_numpy(id).to(self.device),
+            )
+            preds = self._invert_to_prediction(
+                pred_abs_factor=pred_abs_factor, pred_sign_factor=pred_sign_factor
+            )
+            probabilities = self._build_probabilities(pred_sign_factor=pred_sign_factor)
+
+        predictions = preds.cpu().numpy() * self.label_slope[id] + self.label_offset[id]
+
+        return predictions, probabilities.cpu().numpy()
+
+    def _compare_predictions(self, model, exported_model, inputs):
+        predictions = []
+        exported_predictions = []
+        with torch.inference_mode():
+            for x, id in inputs:
+                for model_, predictions_ in [
+                    (model, predictions),
+                    (exported_model, exported_predictions),
+                ]:
+                    pred_abs_factor, pred_sign_factor = model_(x, id)
+                    predictions_.append(
+                        self._invert_to_prediction(
+                            pred_abs_factor=pred_abs_factor,
+                            pred_sign_factor=pred_sign_factor,
+                        )
+                    )
+
+        predictions = torch.cat(predictions)
+        exported_predictions = torch.cat(exported_predictions)
+
+        return {
+            "max_abs_diff": (predictions - exported_predictions).abs().max().item(),
+            "corr": np.corrcoef(
+                predictions.cpu().numpy(), exported_predictions.cpu().numpy()
+            )[0, 1],
+            "sign_agreement": ((predictions >= 0) == (exported_predictions >= 0))
+            .float()
+            .mean()
+            .item(),
+        }
+
+    def _build_calibration_inputs(self, n_calibration_batches, seed):
+        # Test loader is ordered by asset & time, so sample across them with a seed
+        dataset = self.test_data_loader.dataset
+        sampler = BatchSampler(
+            RandomSampler(dataset, generator=torch.Generator().manual_seed(seed)),
+            batch_size=self.model_config["batch_size"],
+            drop_last=False,
+        )
+        if self.data_config["batch_sampling"]:
+            data_loader = DataLoader(dataset=dataset, sampler=sampler, batch_size=None)
+        else:
+            data_loader = DataLoader(dataset=dataset, batch_sampler=sampler)
+
+        return [
+            (data_dict["X"].to(self.device), data_dict["ID"].to(self.device))
+            for data_dict in islice(data_loader, n_calibration_batches)
+        ]
+
+    def export_model(
+        self, quantization=None, batch_size=8, n_calibration_batches=16, seed=0
+    ):
+        """
+        Trace the model and freeze it into TorchScript, which folds weights and fuses ops.
+        quantization: None, dynamic or static(int8), static is calibrated with batches
+        sampled randomly (seed) from test set, so it needs test mode.
+        Agreement of exported predictions with fp32 is reported.
+        """
+        assert self.mode in ("test", "predict")
+        assert quantization in (None, "dynamic", "static")
+        model = (
+            self.model.module if isinstance(self.model, nn.DataParallel) else self.model
+        )
+        model.eval()
+
+        # Inputs to trace and compare: test batches if there is test set
+        if self.mode == "test":
+            inputs = self._build_calibration_inputs(
+                n_calibration_batches=n_calibration_batches, seed=seed
+            )
+        else:
+            assert quantization != "static"
+            inputs = [
+                (
+                    torch.randn(
+                        batch_size,
+                        self.model_config["model_params"]["in_channels"],
+                        self.model_config["lookback_window"],
+                    ).to(self.device),
+                    torch.randint(
+                        self.model_config["model_params"]["n_assets"], (batch_size,)
+                    ).to(self.device),
+                )
+            ]
+
+        exported_model = model
+        if quantization is not None:
+            # Quantized kernels are for CPU
+            assert self.device == "cpu"
+            exported_model = quantize_model(
+                model=model, quantization=quantization, calibration_inputs=inputs
+            )
+
+        with torch.inference_mode():
+            exported_model = torch.jit.freeze(
+                torch.jit.trace(exported_model, inputs[0])
+            )
+
+        agreement = self._compare_predictions(
+            model=model, exported_model=exported_model, inputs=inputs
+        )
+        print(
+            "[+] Agreement with fp32 | "
+            + ", ".join([f"{key}: {value:.4f}" for key, value in agreement.items()])
+        )
+
+        # Without quantization, exported model should be the same with the eager one
+        if quantization is None:
+            assert agreement["max_abs_diff"] < 1e-4
+
+        save_path = self._build_exported_model_path(quantization=quantization)
+        torch.jit.save(exported_model, save_path)
+        print(f"[+] Model is exported: {save_path}")
+
+        return agreement
+
+    def load_exported_model(self, quantization=None):
+        assert self.mode in ("predict")
+        self.model = torch.jit.load(
+            self._build_exported_model_path(quantization=quantization),
+            map_location=self.device,
+        )
+        self.model.eval()
+
+        print(
+            f"[+] Exported model is loaded, Epoch: {self.last_epoch}, Quantization: {quantization}"
+        )
+
 
 if __name__ == "__main__":
     import fire
@@ -1,5 +1,7 @@
 import os
+import json
 import shutil
+from glob import glob
 import pandas as pd
 import numpy as np
 import torch
@@ -25,6 +27,9 @@ DATA_CONFIG = {
     "checkpoint_dir": "./check_point",
     "generate_output_dir": "./generated_output",
     "base_feature_assets": ["BTC-USDT"],
+    "dataset_type": "ArrayDataset",
+    "batch_sampling": True,
+    "cache_extracted_features": True,
 }
 
 MODEL_CONFIG = {
@@ -92,6 +97,7 @@ class StackPredictorV1(BasicPredictor):
             default_m_config=default_m_config,
         )
 
+        self.feature_extractor_dir = feature_extractor_dir
         self._build_feature_extractor_params(
             feature_extractor_dir=feature_extractor_dir
         )
@@ -103,6 +109,13 @@ class StackPredictorV1(BasicPredictor):
             == self.model_config["lookback_window"]
         )
 
+        if mode in ("train", "test") and self.data_config["cache_extracted_features"]:
+            self._attach_extracted_features(mode=mode)
+
+        # Ring buffer of extractor outputs, for predict with consecutive timestamps
+        self.features_buffer = None
+        self.features_buffer_timestamps = None
+
     def _build_feature_extractor_params(self, feature_extractor_dir):
         self.feature_extractor_params = load_json(
             os.path.join(feature_extractor_dir, "trainer_params.json")
@@ -117,6 +130,127 @@ class StackPredictorV1(BasicPredictor):
             mode="predict",
         )
 
+        # Frozen, so outputs for the same window never change
+        self.feature_extractor.model.eval()
+
+    def _build_extracted_features(self, dataset, path):
+        """
+        Run feature extractor once for every (asset, row) which samples look back,
+        and store abs_factor & sign_factor as (asset x 2 x time) npy.
+        """
+        n_assets, _, n_timestamps = dataset.data_caches["X"].shape
+        local_lookback_window = self.model_config["local_lookback_window"]
+        lookback_window = self.feature_extractor_params["model_config"][
+            "lookback_window"
+        ]
+        batch_size = self.model_config["batch_size"]
+
+        keys = np.unique(
+            (
+                (dataset.asset_indices * n_timestamps + dataset.rows)[:, None]
+                - np.arange(local_lookback_window)[None, :]
+            ).ravel()
+        )
+        asset_indices, rows = np.divmod(keys, n_timestamps)
+        asset_ids = np.zeros(n_assets, dtype="int64")
+        asset_ids[dataset.asset_indices] = dataset.ids
+
+        extracted_features = np.lib.format.open_memmap(
+            path, mode="w+", dtype="float32", shape=(n_assets, 2, n_timestamps)
+        )
+        extracted_features[:] = np.nan
+
+        for start in tqdm(range(0, len(keys), batch_size)):
+            batch = slice(start, start + batch_size)
+            X = dataset.gather_windows(
+                rows=rows[batch],
+                asset_indices=asset_indices[batch],
+                lookback_window=lookback_window,
+            )
+            with torch.no_grad():
+                abs_factor, sign_factor = self.feature_extractor.model(
+                    x=torch.from_numpy(X).to(self.device),
+                    id=torch.from_numpy(asset_ids[asset_indices[batch]]).to(
+                        self.device
+                    ),
+                )
+
+            extracted_features[asset_indices[batch], 0, rows[batch]] = (
+                abs_factor.view(-1).cpu().numpy()
+            )
+            extracted_features[asset_indices[batch], 1, rows[batch]] = (
+                sign_factor.view(-1).cpu().numpy()
+            )
+
+        extracted_features.flush()
+
+        return extracted_features
+
+    def _build_files_identity(self, paths):
+        return [
+            {
+                "path": os.path.abspath(path),
+                "mtime": os.path.getmtime(path),
+                "size": os.path.getsize(path),
+            }
+            for path in sorted(paths)
+        ]
+
+    def _attach_extracted_features(self, mode):
+        # Cached outputs are reused while the feature extractor and dataset are the same
+        save_dir = os.path.join(self.exp_dir, "extracted_features")
+        os.makedirs(save_dir, exist_ok=True)
+
+        data_loaders = {"test": (self.test_data_loader, self.test_data_dir)}
+        if mode == "train":
+            data_loaders["train"] = (self.train_data_loader, self.data_dir)
+
+        feature_extractor_checkpoint = os.path.join(
+            self.feature_extractor.data_config["checkpoint_dir"],
+            f"checkpoint-{self.feature_extractor.last_epoch}.ckpt",
+        )
+
+        for data_type, (data_loader, data_dir) in data_loaders.items():
+            dataset = data_loader.dataset
+            assert hasattr(dataset, "set_extracted_features")
+            n_assets, _, n_timestamps = dataset.data_caches["X"].shape
+
+            path = os.path.join(save_dir, f"{data_type}.npy")
+            meta_path = os.path.join(save_dir, f"{data_type}_meta.json")
+            meta = {
+                "feature_extractor_dir": os.path.abspath(self.feature_extractor_dir),
+                "feature_extractor_epoch": self.feature_extractor.last_epoch,
+                "feature_extractor_checkpoint": self._build_files_identity(
+                    paths=[feature_extractor_checkpoint]
+                ),
+                "dataset": self._build_files_identity(
+                    paths=glob(os.path.join(data_dir, "*"))
+                ),
+                "local_lookback_window": self.model_config["local_lookback_window"],
+                "shape": [n_assets, 2, n_timestamps],
+            }
+
+            if os.path.exists(meta_path) and load_json(meta_path) == meta:
+                extracted_features = np.load(path, mmap_mode="r")
+                print(f"[+] Extracted features are loaded: {path}")
+            else:
+                # Meta is written after all outputs are stored
+                if os.path.exists(meta_path):
+                    os.remove(meta_path)
+
+                extracted_features = self._build_extracted_features(
+                    dataset=dataset, path=path
+                )
+                with open(meta_path, "w") as f:
+                    json.dump(meta, f)
+
+                print(f"[+] Extracted features are stored: {path}")
+
+            dataset.set_extracted_features(
+                extracted_features=extracted_features,
+                window=self.model_config["local_lookback_window"],
+            )
+
     def _invert_to_sign(self, pred_sign_factor, boundary=0.5):
         return ((pred_sign_factor >= boundary) * 1.0) + (
             (pred_sign_factor < boundary) * -1.0
@@ -127,6 +261,10 @@ class StackPredictorV1(BasicPredictor):
         return pred_abs_factor * multiply
 
     def _extract_features(self, data_dict):
+        # Cached outputs of the feature extractor, (batch x 2 x local_lookback_window)
+        if "EF" in data_dict:
+            return data_dict["EF"][:, 0], data_dict["EF"][:, 1]
+
         with torch.no_grad():
             abs_factor_features, sign_factor_features = self.feature_extractor.model(
                 x=torch.cat(
@@ -165,11 +303,84 @@ class StackPredictorV1(BasicPredictor):
                 sign_factor_features,
             )
 
-    def _build_stacked_features(self, data_dict):
-        abs_factor_features, sign_factor_features = self._extract_features(
-            data_dict=data_dict
+    def _extract_features_incrementally(self, data_dict, timestamp):
+        """
+        Consecutive minutes share local_lookback_window - 1 windows, so only the newest
+        window is extracted into the ring buffer, whose slot is minute % window.
+        Same timestamp overwrites the newest, cause the last candle could be changed.
+        Assets not updated at the previous or same minute are refilled.
+        """
+        local_lookback_window = self.model_config["local_lookback_window"]
+        if self.features_buffer is None:
+            self.features_buffer = torch.zeros(
+                self.model_config["model_params"]["n_assets"],
+                2,
+                local_lookback_window,
+                device=self.device,
+            )
+            self.features_buffer_timestamps = {}
+
+        # Slots of minutes from the oldest to the newest
+        minute = timestamp.value // (60 * 10 ** 9)
+        slots = (
+            torch.arange(local_lookback_window, device=self.device)
+            + (minute - local_lookback_window + 1)
+        ) % local_lookback_window
+
+        is_refilled = torch.tensor(
+            [
+                self.features_buffer_timestamps.get(id)
+                not in (timestamp, timestamp - pd.Timedelta(minutes=1))
+                for id in data_dict["ID"].tolist()
+            ],
+            device=self.device,
         )
 
+        if is_refilled.any():
+            ids = data_dict["ID"][is_refilled]
+            abs_factor_features, sign_factor_features = self._extract_features(
+                data_dict={"X": data_dict["X"][is_refilled], "ID": ids}
+            )
+            self.features_buffer[ids.unsqueeze(-1), 0, slots] = abs_factor_features
+            self.features_buffer[ids.unsqueeze(-1), 1, slots] = sign_factor_features
+
+        if not is_refilled.all():
+            ids = data_dict["ID"][~is_refilled]
+            with torch.no_grad():
+                abs_factor, sign_factor = self.feature_extractor.model(
+                    x=data_dict["X"][~is_refilled][
+                        :,
+                        :,
+                        -self.feature_extractor_params["model_config"][
+                            "lookback_window"
+                        ] :,
+                    ],
+                    id=ids,
+                )
+
+            self.features_buffer[ids, 0, slots[-1]] = abs_factor
+            self.features_buffer[ids, 1, slots[-1]] = sign_factor
+
+        for id in data_dict["ID"].tolist():
+            self.features_buffer_timestamps[id] = timestamp
+
+        features = self.features_buffer[data_dict["ID"]][:, :, slots]
+
+        return features[:, 0], features[:, 1]
+
+    def _build_stacked_features(self, data_dict, timestamp=None):
+        if timestamp is not None:
+            (
+                abs_factor_features,
+                sign_factor_features,
+            ) = self._extract_features_incrementally(
+                data_dict=data_dict, timestamp=timestamp
+            )
+        else:
+            abs_factor_features, sign_factor_features = self._extract_features(
+                data_dict=data_dict
+            )
+
         return torch.cat(
             [
                 data_dict["X"][:, :, -self.model_config["local_lookback_window"] :],
@@ -425,7 +636,12 @@ class StackPredictorV1(BasicPredictor):
         X: Union[np.ndarray, torch.Tensor],
         id: Union[List, torch.Tensor],
         id_to_asset: Optional[Dict] = None,
+        timestamp: Optional[pd.Timestamp] = None,
     ):
+        """
+        timestamp: the last row of X, if it is given, extracted features of previous
+        minutes are reused, and the feature extractor runs only on the newest window.
+        """
         assert self.mode in ("predict")
         self.model.eval()
 
@@ -435,7 +651,7 @@ class StackPredictorV1(BasicPredictor):
             id = torch.Tensor(id)
 
         data_dict = {"X": X.to(self.device), "ID": id.to(self.device).long()}
-        x = self._build_stacked_features(data_dict=data_dict)
+        x = self._build_stacked_features(data_dict=data_dict, timestamp=timestamp)
 
         (pred_abs_factor, pred_sign_factor, _, _,) = self.model(x=x, id=data_dict["ID"])
 
@@ -1,7 +1,9 @@
 import os
+import copy
 import torch
 from glob import glob
 import torch.nn as nn
+import torch.ao.quantization as tq
 from logging import getLogger
 import pandas as pd
 
@@ -80,3 +82,46 @@ def inverse_preprocess_data(data, scaler):
     )
 
     return processed_data
+
+
+def set_num_threads(intra_op_threads=None, inter_op_threads=None):
+    # Should be called before any inference, inter-op threads can not be changed after
+    if intra_op_threads is not None:
+        torch.set_num_threads(intra_op_threads)
+
+    if inter_op_threads is not None:
+        torch.set_num_interop_threads(inter_op_threads)
+
+
+def quantize_model(model, quantization, calibration_inputs=None):
+    """
+    Post-training int8 quantization of Conv1d & Linear layers (not inplace).
+    dynamic: Linear only, weights are quantized ahead and activations on the fly.
+    static: each Conv1d & Linear is wrapped by Quant/DeQuant stubs, and
+    activation ranges are observed with calibration_inputs, [(x, id), ...].
+    """
+    assert quantization in ("dynamic", "static")
+    model = copy.deepcopy(model).eval()
+
+    if quantization == "dynamic":
+        return tq.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+    assert calibration_inputs is not None
+
+    def wrap(module):
+        for name, child in module.named_children():
+            if isinstance(child, (nn.Conv1d, nn.Linear)):
+                child = tq.QuantWrapper(child)
+                child.qconfig = tq.get_default_qconfig(torch.backends.quantized.engine)
+                setattr(module, name, child)
+            else:
+                wrap(child)
+
+    wrap(model)
+    tq.prepare(model, inplace=True)
+
+    with torch.no_grad():
+        for x, id in calibration_inputs:
+            model(x=x, id=id)
+
+    return tq.convert(model, inplace=True)
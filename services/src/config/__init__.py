@@ -5,6 +5,34 @@ from common_utils_svc import load_json
 from werkzeug.utils import cached_property
 
 
+INFERENCE_PROFILES = {
+    "default": {
+        "exported": False,
+        "quantization": None,
+        "intra_op_threads": None,
+        "inter_op_threads": None,
+    },
+    "exported": {
+        "exported": True,
+        "quantization": None,
+        "intra_op_threads": 2,
+        "inter_op_threads": 1,
+    },
+    "int8": {
+        "exported": True,
+        "quantization": "static",
+        "intra_op_threads": 2,
+        "inter_op_threads": 1,
+    },
+    "int8_dynamic": {
+        "exported": True,
+        "quantization": "dynamic",
+        "intra_op_threads": 2,
+        "inter_op_threads": 1,
+    },
+}
+
+
 @dataclass
 class Config:
     @property
@@ -33,6 +61,17 @@ class Config:
 
         return test_mode
 
+    @cached_property
+    def INFERENCE_PROFILE(self):
+        # Model exported by PredictorV1.export_model & threads of torch for the trader
+        profile = INFERENCE_PROFILES[self.ENV.get("INFERENCE_PROFILE", "default")]
+
+        for key in ["intra_op_threads", "inter_op_threads"]:
+            if key.upper() in self.ENV:
+                profile = {**profile, key: int(self.ENV[key.upper()])}
+
+        return profile
+
     @cached_property
     def DATASET_PARAMS(self):
         return load_json(
@@ -1,7 +1,10 @@
 import ccxt
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
+from collections import defaultdict
 import pandas as pd
 from typing import List
 from config import CFG
@@ -9,6 +12,7 @@ from database import database as DB
 from database.usecase import Usecase
 from logging import getLogger
 from common_utils_svc import initialize_main_logger
+from .kline_stream import KlineStream, STREAM_URL
 
 
 logger = getLogger("data_collector")
@@ -21,10 +25,21 @@ class DataCollector:
     binance_cli: ccxt.binance = ccxt.binance(
         {"timeout": 30000, "options": {"defaultType": "future"},}
     )
+    retention_minutes: int = 1500
+    retention_interval_minutes: int = 10
+    max_concurrent_fetches: int = 8
+    use_stream: bool = False
+    stream_url: str = STREAM_URL
+    stream_grace_seconds: float = 5.0
 
     def __post_init__(self):
         DB.init()
 
+        # Fetch symbols concurrently, but bound requests in flight and their pace
+        self.fetch_semaphore = threading.BoundedSemaphore(self.max_concurrent_fetches)
+        self.fetch_lock = threading.Lock()
+        self.last_fetch_at = 0.0
+
         self._set_target_coins()
         self._sync_historical_pricing(now=pd.Timestamp.utcnow())
 
@@ -38,41 +53,40 @@ class DataCollector:
             ]
         )
 
-    def _build_inserts_dict_to_sync(self, now: pd.Timestamp, limit: int):
+    def _build_inserts_to_sync(self, now: pd.Timestamp, limit: int):
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_fetches) as executor:
+            pricings = list(
+                executor.map(
+                    lambda asset: self._list_historical_pricing(
+                        now=now, symbol=asset, limit=limit
+                    ),
+                    self.tradable_coins,
+                )
+            )
+
         inserts_pricings = []
         synced_timestamps = None
-        for asset in self.tradable_coins:
-            pricing = self._list_historical_pricing(now=now, symbol=asset, limit=limit)
-
-            for pricing_row in pricing.reset_index(drop=False).to_dict(
-                orient="records"
-            ):
-                inserts_pricings.append(
-                    {
-                        "timestamp": pricing_row["date"],
-                        "asset": asset,
-                        "open": pricing_row["open"],
-                        "high": pricing_row["high"],
-                        "low": pricing_row["low"],
-                        "close": pricing_row["close"],
-                        "volume": pricing_row["volume"],
-                    }
-                )
+        for asset, pricing in zip(self.tradable_coins, pricings):
+            inserts_pricings.append(
+                pricing.rename_axis("timestamp")
+                .reset_index(drop=False)
+                .assign(asset=asset)
+            )
 
             if synced_timestamps is None:
                 synced_timestamps = pricing.index
             else:
                 synced_timestamps = synced_timestamps & pricing.index
 
-        inserts_syncs = [
-            {"timestamp": synced_timestamp}
-            for synced_timestamp in synced_timestamps.sort_values().tolist()
+        inserts_pricings = pd.concat(inserts_pricings, ignore_index=True)[
+            ["timestamp", "asset", "open", "high", "low", "close", "volume"]
         ]
+        inserts_syncs = pd.DataFrame({"timestamp": synced_timestamps.sort_values()})
 
         return (inserts_pricings, inserts_syncs)
 
     def _sync_historical_pricing(self, now: pd.Timestamp, limit: int = 1500):
-        inserts_pricings, inserts_syncs = self._build_inserts_dict_to_sync(
+        inserts_pricings, inserts_syncs = self._build_inserts_to_sync(
             now=now, limit=limit
         )
 
@@ -81,18 +95,76 @@ class DataCollector:
         logger.info(f"[+] Synced: historical pricings")
 
     def _sync_live_pricing(self, now: pd.Timestamp, limit: int = 10):
-        inserts_pricings, inserts_syncs = self._build_inserts_dict_to_sync(
+        inserts_pricings, inserts_syncs = self._build_inserts_to_sync(
             now=now, limit=limit
         )
 
         self.usecase.update_pricings(updates=inserts_pricings)
         self.usecase.update_syncs(updates=inserts_syncs)
 
-        self.usecase.delete_old_records(
-            table="pricings", limit=1500 * len(self.tradable_coins)
+    def _on_closed_candle(self, timestamp: pd.Timestamp, asset: str, candle: dict):
+        # Write each closed candle at once, and sync when all coins are closed
+        try:
+            self.usecase.update_pricings(
+                updates=[{"timestamp": timestamp, "asset": asset, **candle}]
+            )
+        except Exception:
+            # Failed transaction should be closed, or later candles fail in this thread
+            self.usecase.sess.rollback()
+            logger.error(f"[!] Error: stream write, {asset} {timestamp}", exc_info=True)
+            return
+
+        self.streamed_assets[timestamp].add(asset)
+        if len(self.streamed_assets[timestamp]) != len(self.tradable_coins):
+            return
+
+        try:
+            self.usecase.update_syncs(updates=[{"timestamp": timestamp}])
+        except Exception:
+            # Left to REST sync of the main loop
+            self.usecase.sess.rollback()
+            logger.error(f"[!] Error: stream sync, {timestamp}", exc_info=True)
+            return
+
+        logger.info(f"[+] Synced: {timestamp} by stream")
+
+        for streamed_on in list(self.streamed_assets.keys()):
+            if streamed_on <= timestamp:
+                del self.streamed_assets[streamed_on]
+
+    def _start_kline_stream(self):
+        self.streamed_assets = defaultdict(set)
+        self.kline_stream = KlineStream(
+            assets=self.tradable_coins,
+            on_closed_candle=self._on_closed_candle,
+            url=self.stream_url,
         )
-        self.usecase.delete_old_records(table="syncs", limit=1500)
-        self.usecase.delete_old_records(table="trades", limit=1500)
+        self.kline_stream.start()
+
+    def _delete_old_records(self, now: pd.Timestamp):
+        before_on = now.floor("T") - pd.Timedelta(minutes=self.retention_minutes)
+
+        for table in ("pricings", "syncs", "trades"):
+            self.usecase.delete_old_records(table=table, before_on=before_on)
+
+        self.last_retention_on = now
+        logger.info(f"[+] Deleted: records before {before_on}")
+
+    def _fetch_ohlcv(self, **kwargs):
+        with self.fetch_semaphore:
+            # Space out starts of requests by rateLimit(ms) of exchange
+            with self.fetch_lock:
+                wait_seconds = (
+                    self.last_fetch_at
+                    + (self.binance_cli.rateLimit / 1000)
+                    - time.monotonic()
+                )
+                if wait_seconds > 0:
+                    time.sleep(wait_seconds)
+
+                self.last_fetch_at = time.monotonic()
+
+            return self.binance_cli.fetch_ohlcv(**kwargs)
 
     def _list_historical_pricing(
         self, now: pd.Timestamp, symbol: str, limit: int = 1500
@@ -100,21 +172,17 @@ class DataCollector:
         assert limit < 2000
 
         if limit >= 1000:
-            pricing = self.binance_cli.fetch_ohlcv(
-                symbol=symbol, timeframe="1m", limit=1000
-            )
+            pricing = self._fetch_ohlcv(symbol=symbol, timeframe="1m", limit=1000)
 
             ext_limit = (limit + 1) - 1000
-            pricing += self.binance_cli.fetch_ohlcv(
+            pricing += self._fetch_ohlcv(
                 symbol=symbol,
                 timeframe="1m",
                 limit=ext_limit,
                 since=(pricing[0][0] - (60 * ext_limit * 1000)),
             )
         else:
-            pricing = self.binance_cli.fetch_ohlcv(
-                symbol=symbol, timeframe="1m", limit=limit + 1
-            )
+            pricing = self._fetch_ohlcv(symbol=symbol, timeframe="1m", limit=limit + 1)
 
         pricing = pd.DataFrame(
             pricing, columns=["date", "open", "high", "low", "close", "volume"]
@@ -138,13 +206,24 @@ class DataCollector:
         """
         logger.info("[O] Start: demon of data_collector")
 
+        self.kline_stream = None
+        if self.use_stream is True:
+            self._start_kline_stream()
+
         error_count = 0
+        self.last_retention_on = None
         while True:
             try:
                 now = pd.Timestamp.utcnow()
                 minutes_to_sync = self._get_minutes_to_sync(now=now)
 
-                if minutes_to_sync != 0:
+                # Closed candles are written by stream, REST sync only fills gaps
+                is_waiting_stream = (self.kline_stream is not None) and (
+                    now - now.floor("T")
+                    < pd.Timedelta(seconds=self.stream_grace_seconds)
+                )
+
+                if (minutes_to_sync != 0) and (is_waiting_stream is False):
                     minutes_to_sync = min(max(minutes_to_sync, 5), 1500)
 
                     self._sync_live_pricing(now=now, limit=minutes_to_sync)
@@ -152,6 +231,16 @@ class DataCollector:
 
                     error_count = 0
 
+                # Retention runs on its own cadence, not on every sync
+                elif (minutes_to_sync == 0) and (
+                    (self.last_retention_on is None)
+                    or (
+                        now - self.last_retention_on
+                        >= pd.Timedelta(minutes=self.retention_interval_minutes)
+                    )
+                ):
+                    self._delete_old_records(now=now)
+
             except Exception as e:
                 error_count += 1
 
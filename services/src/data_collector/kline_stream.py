@@ -0,0 +1,91 @@
+import json
+import time
+import threading
+import websocket
+import pandas as pd
+from typing import Callable, List
+from logging import getLogger
+
+
+logger = getLogger("data_collector")
+
+STREAM_URL = "wss://fstream.binance.com/stream"
+
+
+class KlineStream:
+    """
+    Subscribe combined kline streams of symbols on a background thread,
+    and call on_closed_candle(timestamp, asset, candle) for each closed candle.
+    It reconnects when the connection is dropped, until stop is called.
+    """
+
+    def __init__(
+        self,
+        assets: List[str],
+        on_closed_candle: Callable,
+        url: str = STREAM_URL,
+        interval: str = "1m",
+        reconnect_seconds: float = 1.0,
+    ):
+        # BTC/USDT -> BTCUSDT, which is the symbol of stream messages
+        self.symbol_to_asset = {asset.replace("/", ""): asset for asset in assets}
+        self.on_closed_candle = on_closed_candle
+        self.url = (
+            url
+            + "?streams="
+            + "/".join(
+                [
+                    f"{symbol.lower()}@kline_{interval}"
+                    for symbol in self.symbol_to_asset.keys()
+                ]
+            )
+        )
+        self.reconnect_seconds = reconnect_seconds
+
+        self.ws_app = None
+        self.thread = None
+        self.is_running = False
+
+    def _on_message(self, ws_app, message):
+        kline = json.loads(message)["data"]["k"]
+        if kline["x"] is not True:
+            return
+
+        self.on_closed_candle(
+            timestamp=pd.Timestamp(kline["t"], unit="ms", tz="UTC"),
+            asset=self.symbol_to_asset[kline["s"]],
+            candle={
+                "open": float(kline["o"]),
+                "high": float(kline["h"]),
+                "low": float(kline["l"]),
+                "close": float(kline["c"]),
+                "volume": float(kline["v"]),
+            },
+        )
+
+    def _on_error(self, ws_app, error):
+        logger.info(f"[!] Error: kline stream, {error}")
+
+    def _run(self):
+        while self.is_running is True:
+            self.ws_app = websocket.WebSocketApp(
+                self.url, on_message=self._on_message, on_error=self._on_error
+            )
+            self.ws_app.run_forever()
+
+            if self.is_running is True:
+                time.sleep(self.reconnect_seconds)
+
+    def start(self):
+        self.is_running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info("[O] Start: kline stream")
+
+    def stop(self):
+        self.is_running = False
+        if self.ws_app is not None:
+            self.ws_app.close()
+
+        if self.thread is not None:
+            self.thread.join()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, FLOAT, String, TIMESTAMP, UniqueConstraint
+from sqlalchemy import Column, Integer, FLOAT, String, TIMESTAMP, Index
 from database import database as DB
 
 
@@ -15,7 +15,10 @@ class Pricing(DB.BASE):
     close = Column(FLOAT, nullable=False)
     volume = Column(FLOAT, nullable=False)
 
-    __table_args__ = (UniqueConstraint("timestamp", "asset"),)
+    # Serves range reads, retention on timestamp and conflicts of upsert
+    __table_args__ = (
+        Index("ix_pricings_timestamp_asset", "timestamp", "asset", unique=True),
+    )
 
     def __init__(self, timestamp, asset, open, high, low, close, volume):
         self.timestamp = timestamp
@@ -1,8 +1,17 @@
 from dataclasses import dataclass
 from database import database as DB
 from database import models
-from typing import List, Dict
+from typing import List, Dict, Union
+import io
+import select
+import psycopg2
+import numpy as np
 import pandas as pd
+from sqlalchemy import text
+from psycopg2.extras import execute_values
+
+
+SYNC_CHANNEL = "syncs"
 
 
 @dataclass
@@ -14,20 +23,23 @@ class Usecase:
 
     def get_pricing(self, start_on: pd.Timestamp, end_on: pd.Timestamp):
         pricing = self.sess.execute(
-            f"""
-            select
-                timestamp,
-                asset,
-                open,
-                high,
-                low,
-                close,
-                volume
-            from pricings
-            where
-                timestamp >= '{start_on.isoformat()}'::timestamp and
-                timestamp <= '{end_on.isoformat()}'::timestamp;
-            """
+            text(
+                """
+                select
+                    timestamp,
+                    asset,
+                    open,
+                    high,
+                    low,
+                    close,
+                    volume
+                from pricings
+                where
+                    timestamp >= :start_on and
+                    timestamp <= :end_on;
+                """
+            ),
+            {"start_on": start_on, "end_on": end_on},
         ).fetchall()
 
         pricing = pd.DataFrame(
@@ -39,6 +51,59 @@ class Usecase:
 
         return pricing
 
+    def get_wide_pricing(self, start_on: pd.Timestamp, end_on: pd.Timestamp):
+        """
+        Same rows with get_pricing, but in (timestamp x (asset, OHLCV)) layout,
+        built from column arrays without MultiIndex rows and unstack.
+        """
+        cursor = self.sess.connection().connection.cursor()
+        try:
+            cursor.execute(
+                """
+                select
+                    extract(epoch from timestamp)::bigint,
+                    asset,
+                    open,
+                    high,
+                    low,
+                    close,
+                    volume
+                from pricings
+                where
+                    timestamp >= %(start_on)s and
+                    timestamp <= %(end_on)s
+                order by timestamp, asset;
+                """,
+                {
+                    "start_on": start_on.to_pydatetime(),
+                    "end_on": end_on.to_pydatetime(),
+                },
+            )
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        fields = ["open", "high", "low", "close", "volume"]
+        if len(rows) == 0:
+            return pd.DataFrame(
+                index=pd.DatetimeIndex([], tz="UTC", name="timestamp"),
+                columns=pd.MultiIndex.from_product([[], fields]),
+                dtype="float64",
+            )
+
+        epochs, assets, *values = zip(*rows)
+        timestamp_codes, timestamps = pd.factorize(np.array(epochs, dtype="int64"))
+        asset_codes, assets = pd.factorize(np.array(assets, dtype=object), sort=True)
+
+        wide = np.full((len(timestamps), len(assets), len(fields)), np.nan)
+        wide[timestamp_codes, asset_codes] = np.array(values, dtype="float64").T
+
+        return pd.DataFrame(
+            wide.reshape(len(timestamps), -1),
+            index=pd.to_datetime(timestamps, unit="s", utc=True).rename("timestamp"),
+            columns=pd.MultiIndex.from_product([assets, fields]),
+        )
+
     def get_last_sync_on(self):
         quried = (
             self.sess.query(models.Sync).order_by(models.Sync.timestamp.desc()).first()
@@ -60,78 +125,84 @@ class Usecase:
 
         return pd.Timestamp(queried.timestamp).tz_convert("UTC").floor("T")
 
-    def insert_pricings(self, inserts: List[Dict], n_buffer: int = 500):
-        tmpl = """
-        INSERT INTO
-            pricings (
-                timestamp,
-                asset,
-                open,
-                high,
-                low,
-                close,
-                volume
+    def _copy_records(self, table: str, records: pd.DataFrame, columns: List[str]):
+        # Stream rows with COPY FROM STDIN, in the transaction of session
+        buffer = io.StringIO()
+        records.to_csv(buffer, columns=columns, header=False, index=False)
+        buffer.seek(0)
+
+        cursor = self.sess.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table} ({','.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                buffer,
             )
-        VALUES {};
-        """.strip()
-
-        def to_tuple(x, i):
-            return (
-                f"(:p{i}_1,:p{i}_2,:p{i}_3,:p{i}_4,:p{i}_5,:p{i}_6,:p{i}_7)",
-                (
-                    {
-                        f"p{i}_1": x["timestamp"],
-                        f"p{i}_2": x["asset"],
-                        f"p{i}_3": x["open"],
-                        f"p{i}_4": x["high"],
-                        f"p{i}_5": x["low"],
-                        f"p{i}_6": x["close"],
-                        f"p{i}_7": x["volume"],
-                    }
-                ),
+        finally:
+            cursor.close()
+
+    def insert_pricings(self, inserts: Union[List[Dict], pd.DataFrame]):
+        if not isinstance(inserts, pd.DataFrame):
+            inserts = pd.DataFrame(inserts)
+
+        if len(inserts) != 0:
+            self._copy_records(
+                table="pricings",
+                records=inserts,
+                columns=[
+                    "timestamp",
+                    "asset",
+                    "open",
+                    "high",
+                    "low",
+                    "close",
+                    "volume",
+                ],
             )
 
-        for i in range(0, len(inserts), n_buffer):
-
-            items = [
-                to_tuple(item, j) for j, item in enumerate(inserts[i : i + n_buffer])
-            ]
-
-            query = tmpl.format(",".join([item[0] for item in items]))
-
-            params = {}
-            for item in items:
-                params.update(item[1])
+        self.sess.commit()
 
-            self.sess.execute(query, params)
+    def _notify_syncs(self, timestamp: pd.Timestamp):
+        # Delivered to listeners when the transaction of session is committed
+        self.sess.execute(
+            text("SELECT pg_notify(:channel, :payload);"),
+            {"channel": SYNC_CHANNEL, "payload": timestamp.isoformat()},
+        )
 
-        self.sess.commit()
+    def listen_syncs(self):
+        # Dedicated connection out of the pool of session, which receives notifications
+        self.listen_conn = psycopg2.connect(
+            connect_timeout=60,
+            **DB.ENGINE.url.translate_connect_args(username="user"),
+        )
+        self.listen_conn.autocommit = True
 
-    def insert_syncs(self, inserts: List[Dict], n_buffer: int = 500):
-        tmpl = """
-        INSERT INTO
-            syncs (
-                timestamp
-            )
-        VALUES {};
-        """.strip()
+        cursor = self.listen_conn.cursor()
+        cursor.execute(f"LISTEN {SYNC_CHANNEL};")
+        cursor.close()
 
-        def to_tuple(x, i):
-            return (f"(:p{i}_1)", ({f"p{i}_1": x["timestamp"]}))
+    def wait_syncs(self, timeout: float):
+        """
+        Block until syncs are committed or timeout is reached.
+        Returns whether a notification is received.
+        """
+        if len(self.listen_conn.notifies) == 0:
+            if select.select([self.listen_conn], [], [], timeout) == ([], [], []):
+                return False
 
-        for i in range(0, len(inserts), n_buffer):
+            self.listen_conn.poll()
 
-            items = [
-                to_tuple(item, j) for j, item in enumerate(inserts[i : i + n_buffer])
-            ]
+        notified = len(self.listen_conn.notifies) != 0
+        self.listen_conn.notifies.clear()
 
-            query = tmpl.format(",".join([item[0] for item in items]))
+        return notified
 
-            params = {}
-            for item in items:
-                params.update(item[1])
+    def insert_syncs(self, inserts: Union[List[Dict], pd.DataFrame]):
+        if not isinstance(inserts, pd.DataFrame):
+            inserts = pd.DataFrame(inserts)
 
-            self.sess.execute(query, params)
+        if len(inserts) != 0:
+            self._copy_records(table="syncs", records=inserts, columns=["timestamp"])
+            self._notify_syncs(timestamp=inserts["timestamp"].max())
 
         self.sess.commit()
 
@@ -140,94 +211,94 @@ class Usecase:
 
         self.sess.commit()
 
-    def update_pricings(self, updates: List[Dict], n_buffer: int = 500):
-        tup_str = ""
-        min_timestamp = []
-        for update in updates:
-            tup_str += f"('{update['timestamp'].isoformat()}'::timestamp, '{update['asset']}'),"
-            min_timestamp.append(update["timestamp"])
-        tup_str = tup_str[:-1]
-        min_timestamp = min(min_timestamp)
-
-        db_items = self.sess.execute(
-            f"""
-            SELECT id,
-                    TIMESTAMP,
-                    asset,
-                    volume
-            FROM   pricings
-            WHERE  ( TIMESTAMP, asset ) IN (VALUES {tup_str})
-                    AND TIMESTAMP >= '{min_timestamp.isoformat()}'::timestamp;
-            """
-        )
+    def _execute_values(
+        self, query: str, records: pd.DataFrame, columns: List[str], template: str
+    ):
+        # Send all rows as one statement, in the transaction of session
+        cursor = self.sess.connection().connection.cursor()
+        try:
+            execute_values(
+                cursor,
+                query,
+                list(records[columns].itertuples(index=False, name=None)),
+                template=template,
+                page_size=max(len(records), 1),
+            )
 
-        key = lambda ts, asset: f"{ts.isoformat()}_{asset}"
-        db_items_dict = dict()
-        for db_item in db_items:
-            db_items_dict[key(ts=db_item[1], asset=db_item[2])] = {
-                "id": db_item[0],
-                "volume": db_item[3],
-            }
-
-        ids_to_delete = list()
-        to_insert = list()
-        for update in updates:
-            k = key(ts=update["timestamp"], asset=update["asset"])
-            if k in db_items_dict:
-                db_item = db_items_dict[k]
-                if db_item["volume"] != update["volume"]:
-                    # Value changed
-                    ids_to_delete.append(db_item["id"])
-                else:
-                    continue
-
-            to_insert.append(update)
-
-        # Delete if changed
-        self.sess.query(models.Pricing).filter(
-            models.Pricing.id.in_(ids_to_delete)
-        ).delete(synchronize_session=False)
-
-        # Insert
-        if len(to_insert):
-            self.insert_pricings(inserts=to_insert, n_buffer=n_buffer)
-        else:
-            self.sess.commit()
-
-    def update_syncs(self, updates: List[Dict], n_buffer: int = 500):
-        tup_str = ""
-        min_timestamp = []
-        for update in updates:
-            tup_str += f"('{update['timestamp'].isoformat()}'::timestamp),"
-            min_timestamp.append(update["timestamp"])
-        tup_str = tup_str[:-1]
-        min_timestamp = min(min_timestamp)
-
-        db_items = self.sess.execute(
-            f"""
-            SELECT TIMESTAMP
-            FROM   syncs
-            WHERE  ( TIMESTAMP ) IN (VALUES {tup_str})
-                    AND TIMESTAMP >= '{min_timestamp.isoformat()}'::timestamp;
-            """
-        )
+            # Rows affected, which is of the whole records as one page
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+    def update_pricings(self, updates: Union[List[Dict], pd.DataFrame]):
+        if not isinstance(updates, pd.DataFrame):
+            updates = pd.DataFrame(updates)
+
+        if len(updates) != 0:
+            # Insert new rows, and overwrite rows whose volume is changed
+            self._execute_values(
+                query="""
+                INSERT INTO
+                    pricings (
+                        timestamp,
+                        asset,
+                        open,
+                        high,
+                        low,
+                        close,
+                        volume
+                    )
+                VALUES %s
+                ON CONFLICT (timestamp, asset) DO UPDATE
+                SET
+                    open = EXCLUDED.open,
+                    high = EXCLUDED.high,
+                    low = EXCLUDED.low,
+                    close = EXCLUDED.close,
+                    volume = EXCLUDED.volume
+                WHERE pricings.volume IS DISTINCT FROM EXCLUDED.volume;
+                """,
+                records=updates,
+                columns=[
+                    "timestamp",
+                    "asset",
+                    "open",
+                    "high",
+                    "low",
+                    "close",
+                    "volume",
+                ],
+                template="(%s,%s,%s,%s,%s,%s,%s)",
+            )
 
-        key = lambda ts: f"{ts.isoformat()}"
-        db_timestamps = set([key(ts=db_item[0]) for db_item in db_items])
+        self.sess.commit()
 
-        to_insert = list()
-        for update in updates:
-            k = key(ts=update["timestamp"])
-            if k in db_timestamps:
-                continue
+    def update_syncs(self, updates: Union[List[Dict], pd.DataFrame]):
+        if not isinstance(updates, pd.DataFrame):
+            updates = pd.DataFrame(updates)
+
+        if len(updates) != 0:
+            n_inserted = self._execute_values(
+                query="""
+                INSERT INTO
+                    syncs (
+                        timestamp
+                    )
+                VALUES %s
+                ON CONFLICT (timestamp) DO NOTHING;
+                """,
+                records=updates,
+                columns=["timestamp"],
+                template="(%s)",
+            )
 
-            to_insert.append(update)
+            # Already synced minutes are not notified again
+            if n_inserted > 0:
+                self._notify_syncs(timestamp=updates["timestamp"].max())
 
-        # Insert
-        if len(to_insert):
-            self.insert_syncs(inserts=to_insert, n_buffer=n_buffer)
+        self.sess.commit()
 
-    def delete_old_records(self, table: str, limit: int):
+    def delete_old_records(self, table: str, before_on: pd.Timestamp):
         assert table in ("pricings", "syncs", "trades")
         if table == "pricings":
             table_class = models.Pricing
@@ -238,21 +309,8 @@ class Usecase:
         else:
             raise NotImplementedError
 
-        table_counts = self.sess.execute(
-            f"""
-            SELECT count(*)
-            FROM   {table};
-            """
-        ).first()[0]
-
-        if table_counts > limit:
-            # Delete overflowed records
-            id_subqueries = (
-                self.sess.query(table_class.id)
-                .order_by(table_class.timestamp.asc())
-                .limit(table_counts - limit)
-            )
-            self.sess.query(table_class).filter(
-                table_class.id.in_(id_subqueries)
-            ).delete(synchronize_session=False)
-            self.sess.commit()
+        # Range delete on the index of timestamp
+        self.sess.query(table_class).filter(table_class.timestamp < before_on).delete(
+            synchronize_session=False
+        )
+        self.sess.commit()
@@ -23,6 +23,8 @@ class CustomClient:
         )
         self.test_mode = CFG.TEST_MODE
         self.tradable_coins = CFG.TRADABLE_COINS
+        self.balance_snapshot = None
+        self.account_open_orders = None
 
         self.__set_test_mode()
         self.__set_dual_position_mode()
@@ -87,6 +89,50 @@ class CustomClient:
 
             time.sleep(0.1)
 
+    def get_balance_snapshot(self):
+        # Balance shared in a tick, fetched once until it is invalidated
+        if self.balance_snapshot is None:
+            self.balance_snapshot = self.get_balance()
+
+        return self.balance_snapshot
+
+    def invalidate_balance_snapshot(self):
+        # Should be called after orders, which change positions and cache
+        self.balance_snapshot = None
+
+    def invalidate_account_state(self):
+        # get_account_open_orders needs load_account_state again after this
+        self.account_open_orders = None
+
+    def load_account_state(self):
+        """
+        Load open orders of all symbols in one request, instead of one per symbol.
+        They are queried per symbol with get_account_open_orders, until reloaded.
+        """
+        self.binance_cli.options["warnOnFetchOpenOrdersWithoutSymbol"] = False
+        orders = self.binance_cli.fetch_open_orders()
+        orders = pd.DataFrame([order["info"] for order in orders])
+
+        if len(orders) != 0:
+            orders["symbol"] = self.revision_symbols(orders["symbol"])
+        self.account_open_orders = orders
+
+    def get_account_open_orders(self, symbol):
+        assert self.account_open_orders is not None
+
+        if len(self.account_open_orders) == 0:
+            return self.account_open_orders
+
+        return self.account_open_orders[self.account_open_orders["symbol"] == symbol]
+
+    def get_entry_at(self, position_info):
+        # updateTime of position is the last time it is filled, which needs no request
+        update_time = int(position_info.get("updateTime", 0) or 0)
+        if update_time == 0:
+            return self.get_last_trade_on(symbol=position_info["symbol"])
+
+        return pd.Timestamp(update_time, unit="ms", tz="UTC").floor("T")
+
     def get_last_trade_on(self, symbol):
         orders = self.get_closed_orders(symbol=symbol)
         orders = orders[orders["status"] == "FILLED"]
@@ -116,8 +162,8 @@ class CustomClient:
 
         return positions
 
-    def get_position_objects(self, symbol=None, with_entry_at=False):
-        posis = self.get_positions(symbol=symbol)
+    def get_position_objects(self, symbol=None, with_entry_at=False, balance=None):
+        posis = self.get_positions(balance=balance, symbol=symbol)
         posis = posis[posis["positionAmt"].astype(float) != 0.0]
         assert posis["symbol"].is_unique
 
@@ -128,7 +174,7 @@ class CustomClient:
                 side=posi["positionSide"].lower(),
                 qty=float(posi["positionAmt"]),
                 entry_price=float(posi["entryPrice"]),
-                entry_at=self.get_last_trade_on(symbol=posi["symbol"])
+                entry_at=self.get_entry_at(position_info=posi)
                 if with_entry_at is True
                 else None,
                 profit=float(posi["unrealizedProfit"]),
@@ -0,0 +1,61 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+
+
+logger = getLogger("trader")
+
+
+class OrderExecutor:
+    """
+    Submit orders concurrently. Orders in flight are bounded by max_workers,
+    and their starts are spaced by min_interval_seconds for weight limits of exchange.
+    Latency of each order is logged at DEBUG (INFO goes to slack), and the last
+    max_latencies are kept in latencies as (name, seconds).
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        min_interval_seconds: float = 0.0,
+        max_latencies: int = 1000,
+    ):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.min_interval_seconds = min_interval_seconds
+        self.lock = threading.Lock()
+        self.last_started_at = 0.0
+
+        self.futures = []
+        self.latencies = deque(maxlen=max_latencies)
+
+    def _run(self, name, fn, kwargs):
+        with self.lock:
+            wait_seconds = (
+                self.last_started_at + self.min_interval_seconds - time.monotonic()
+            )
+            if wait_seconds > 0:
+                time.sleep(wait_seconds)
+
+            self.last_started_at = time.monotonic()
+
+        started_at = time.monotonic()
+        try:
+            return fn(**kwargs)
+        finally:
+            latency = time.monotonic() - started_at
+            self.latencies.append((name, latency))
+            logger.debug(f"[_] Order: {name}, {latency * 1000:.1f}ms")
+
+    def submit(self, name, fn, **kwargs):
+        future = self.executor.submit(self._run, name, fn, kwargs)
+        self.futures.append(future)
+
+        return future
+
+    def wait(self):
+        # Block until submitted orders are done, errors of orders are raised here
+        futures, self.futures = self.futures, []
+
+        return [future.result() for future in futures]
@@ -1,23 +1,89 @@
+import time
+import queue
 import logging
+import threading
 import requests
 from config import CFG
 
 
 class SlackHandler(logging.StreamHandler):
-    def __init__(self):
+    """
+    Records are put into a bounded queue, and a background thread sends them in
+    batches of batch_seconds, so logging never waits on webhook.
+    Records overflowing the queue are dropped and counted in the next message.
+    """
+
+    def __init__(self, max_queue_size=1000, batch_seconds=1.0, max_batch_size=20):
         super(SlackHandler, self).__init__()
         self.url = CFG.WEBHOOK_URL
 
+        self.batch_seconds = batch_seconds
+        self.max_batch_size = max_batch_size
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.n_dropped = 0
+
+        self.sender = threading.Thread(target=self._send_batches, daemon=True)
+        self.sender.start()
+
     def emit(self, record):
-        msg = self.format(record)
-        self.send_message(msg)
+        try:
+            self.queue.put_nowait(self.format(record))
+        except queue.Full:
+            self.n_dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _send_batches(self):
+        is_closed = False
+        while is_closed is False:
+            text = self.queue.get()
+            if text is None:
+                break
+
+            # Collect messages arrived in batch_seconds
+            texts = [text]
+            batch_until = time.monotonic() + self.batch_seconds
+            while len(texts) < self.max_batch_size:
+                try:
+                    text = self.queue.get(
+                        timeout=max(batch_until - time.monotonic(), 0)
+                    )
+                except queue.Empty:
+                    break
+
+                if text is None:
+                    is_closed = True
+                    break
+
+                texts.append(text)
+
+            if self.n_dropped != 0:
+                texts.append(f"[!] Dropped: {self.n_dropped} messages")
+                self.n_dropped = 0
+
+            # Any error is reported, and the thread keeps draining the queue
+            try:
+                self.send_message(texts)
+            except Exception:
+                self.handleError(logging.makeLogRecord({"msg": "\n".join(texts)}))
+
+    def send_message(self, texts):
+        texts = [
+            "```" + text + " ```" if "[!] Error:" in text else ":sparkles: " + text
+            for text in texts
+        ]
+
+        message = {"text": "\n".join(texts)}
 
-    def send_message(self, text):
-        if "[!] Error:" in text:
-            text = "```" + text + " ```"
-        else:
-            text = ":sparkles: " + text
+        requests.post(self.url, json=message, timeout=10)
 
-        message = {"text": text}
+    def close(self):
+        # Flush queued messages on shutdown, by a sentinel after them
+        if self.sender.is_alive():
+            try:
+                self.queue.put(None, timeout=1)
+                self.sender.join(timeout=10)
+            except queue.Full:
+                pass
 
-        requests.post(self.url, json=message)
+        super(SlackHandler, self).close()
@@ -0,0 +1,82 @@
+import time
+import threading
+import pandas as pd
+from data_collector.data_collector import DataCollector
+
+
+ASSETS = ["ADA/USDT", "BTC/USDT", "ETH/USDT", "XRP/USDT"]
+START_ON = 1609459200000
+NOW = pd.Timestamp("2021-01-03", tz="UTC")
+
+
+class StubExchange:
+    # Records start and end of each call, earlier assets answer slower
+    rateLimit = 20
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def fetch_ohlcv(self, symbol, timeframe, limit, since=None):
+        started_at = time.monotonic()
+        time.sleep(0.02 * (len(ASSETS) - ASSETS.index(symbol)))
+        ended_at = time.monotonic()
+
+        with self.lock:
+            self.calls.append((started_at, ended_at))
+
+        if since is None:
+            since = START_ON + (60 * 1000 * 1500)
+
+        asset_idx = ASSETS.index(symbol)
+        return [
+            [since + (60 * 1000 * idx), asset_idx, asset_idx + 1, asset_idx, idx, 1.0]
+            for idx in range(limit)
+        ]
+
+
+def build_data_collector(max_concurrent_fetches):
+    data_collector = DataCollector.__new__(DataCollector)
+    data_collector.binance_cli = StubExchange()
+    data_collector.max_concurrent_fetches = max_concurrent_fetches
+    data_collector.fetch_semaphore = threading.BoundedSemaphore(max_concurrent_fetches)
+    data_collector.fetch_lock = threading.Lock()
+    data_collector.last_fetch_at = 0.0
+    data_collector.tradable_coins = ASSETS
+
+    return data_collector
+
+
+def test_build_inserts_to_sync_concurrently():
+    data_collector = build_data_collector(max_concurrent_fetches=8)
+    inserts_pricings, inserts_syncs = data_collector._build_inserts_to_sync(
+        now=NOW, limit=1200
+    )
+
+    # Two requests per asset, for limit over 1000
+    calls = sorted(data_collector.binance_cli.calls)
+    assert len(calls) == len(ASSETS) * 2
+
+    # Calls overlap each other
+    assert any(
+        next_started_at < ended_at
+        for (_, ended_at), (next_started_at, _) in zip(calls[:-1], calls[1:])
+    )
+
+    # Starts are spaced by rateLimit
+    min_interval_seconds = data_collector.binance_cli.rateLimit / 1000
+    assert all(
+        next_started_at - started_at >= min_interval_seconds * 0.95
+        for (started_at, _), (next_started_at, _) in zip(calls[:-1], calls[1:])
+    )
+
+    # Same inserts with serial fetches
+    serial_data_collector = build_data_collector(max_concurrent_fetches=1)
+    (
+        serial_inserts_pricings,
+        serial_inserts_syncs,
+    ) = serial_data_collector._build_inserts_to_sync(now=NOW, limit=1200)
+
+    pd.testing.assert_frame_equal(inserts_pricings, serial_inserts_pricings)
+    pd.testing.assert_frame_equal(inserts_syncs, serial_inserts_syncs)
+    assert inserts_pricings["asset"].unique().tolist() == ASSETS
@@ -8,15 +8,19 @@ import joblib
 import pandas as pd
 import numpy as np
 from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 
 from config import CFG
 from trainer.models import PredictorV1
+from trainer.models.utils import set_num_threads
 from database.usecase import Usecase
 from exchange.custom_client import CustomClient
+from exchange.order_executor import OrderExecutor
 from .utils import nan_to_zero
 from logging import getLogger
 from common_utils_svc import initialize_trader_logger, Position
 from dataset_builder.build_dataset import DatasetBuilder
+from dataset_builder.incremental_feature_builder import IncrementalFeatureBuilder
 from trainer.datasets.dataset import build_X_and_BX
 
 
@@ -32,6 +36,9 @@ class TraderV1:
     possible_in_debt = False
     commission = {"entry": 0.0004, "exit": 0.0002, "spread": 0.0004}
     skip_executable_order_check = True  # To prevent api limitation
+    incremental_features = True  # To prevent rebuilding whole features every tick
+    sync_wait_seconds = 10  # Re-check without notification, in case of missing one
+    max_concurrent_orders = 8
 
     def __post_init__(self):
         self.custom_cli = CustomClient()
@@ -46,11 +53,26 @@ class TraderV1:
         )
         self._build_dataset_builder()
         self._build_model()
+
+        # Load account state at once, to restart without requests for each position
+        self.custom_cli.load_account_state()
         self._load_last_entry_at()
         self._initialize_order_books()
 
+        # Open orders are changed by orders from here, so they are not kept
+        self.custom_cli.invalidate_account_state()
+
         self.cached_pricing = None
 
+        # Fetch snapshots of account and tickers, while building predictions
+        self.io_executor = ThreadPoolExecutor(max_workers=2)
+
+        # Send orders of different assets concurrently
+        self.order_executor = OrderExecutor(
+            max_workers=self.max_concurrent_orders,
+            min_interval_seconds=self.custom_cli.binance_cli.rateLimit / 1000,
+        )
+
         if self.skip_executable_order_check is True:
             assert self.order_criterion == "capital"
 
@@ -199,7 +221,19 @@ class TraderV1:
             label_scaler=label_scaler,
         )
 
+        self.feature_builder = IncrementalFeatureBuilder(
+            tradable_coins=self.tradable_coins,
+            feature_columns=self.dataset_builder_params["features_columns"],
+            n_history=CFG.EXP_MODEL_PARAMS["lookback_window"],
+        )
+
     def _build_model(self):
+        inference_profile = CFG.INFERENCE_PROFILE
+        set_num_threads(
+            intra_op_threads=inference_profile["intra_op_threads"],
+            inter_op_threads=inference_profile["inter_op_threads"],
+        )
+
         self.model = PredictorV1(
             exp_dir=CFG.EXP_DIR,
             m_config=CFG.EXP_MODEL_PARAMS,
@@ -208,6 +242,11 @@ class TraderV1:
             mode="predict",
         )
 
+        if inference_profile["exported"] is True:
+            self.model.load_exported_model(
+                quantization=inference_profile["quantization"]
+            )
+
     def _store_last_entry_at(self):
         joblib.dump(self.last_entry_at, LAST_ENTRY_AT_FILE_PATH)
 
@@ -219,7 +258,9 @@ class TraderV1:
             self.last_entry_at = {key: None for key in self.tradable_coins}
 
         # Initialize
-        positions = self.custom_cli.get_position_objects(with_entry_at=True)
+        positions = self.custom_cli.get_position_objects(
+            with_entry_at=True, balance=self.custom_cli.get_balance_snapshot()
+        )
         for position in positions:
             if self.last_entry_at[position.asset] is not None:
                 self.last_entry_at[position.asset] = max(
@@ -229,10 +270,12 @@ class TraderV1:
                 self.last_entry_at[position.asset] = position.entry_at
 
     def _initialize_order_books(self):
-        positions = self.custom_cli.get_position_objects(with_entry_at=False)
+        positions = self.custom_cli.get_position_objects(
+            with_entry_at=False, balance=self.custom_cli.get_balance_snapshot()
+        )
 
         for position in positions:
-            orders = self.custom_cli.get_open_orders(symbol=position.asset)
+            orders = self.custom_cli.get_account_open_orders(symbol=position.asset)
 
             # When already limit order exists, we skip it.
             if len(orders) >= 1:
@@ -260,6 +303,27 @@ class TraderV1:
 
         return features
 
+    def _build_features_incrementally(self, last_sync_on):
+        if self.feature_builder.last_timestamp is None:
+            query_start_on = last_sync_on - pd.Timedelta(
+                minutes=(1320 + CFG.EXP_MODEL_PARAMS["lookback_window"] - 1)
+            )
+        else:
+            # Get from the last candle, cause it has potential to be changed.
+            query_start_on = self.feature_builder.last_timestamp
+
+        pricing = self.usecase.get_wide_pricing(
+            start_on=query_start_on, end_on=last_sync_on
+        )
+        self.feature_builder.update(rawdata=pricing)
+
+        features = self.dataset_builder.preprocess_features(
+            features=self.feature_builder.build_features(),
+            winsorize_threshold=self.dataset_builder_params["winsorize_threshold"],
+        )
+
+        return features
+
     def _build_inputs(self, features):
         features, base_features = build_X_and_BX(
             features=features.astype("float32"),
@@ -283,40 +347,46 @@ class TraderV1:
         return inputs, ids
 
     def build_prediction_dict(self, last_sync_on):
+        if self.incremental_features is True:
+            features = self._build_features_incrementally(last_sync_on=last_sync_on)
+        else:
+            features = self._build_features_from_pricing(last_sync_on=last_sync_on)
+
+        inputs, ids = self._build_inputs(features=features)
+
+        predictions, probabilities = self.model.predict_array(X=inputs, id=ids)
+
+        # inputs are ordered as tradable_coins
+        return {
+            "predictions": pd.Series(predictions, index=self.tradable_coins),
+            "probabilities": pd.Series(probabilities, index=self.tradable_coins),
+        }
+
+    def _build_features_from_pricing(self, last_sync_on):
         query_start_on = last_sync_on - pd.Timedelta(
             minutes=(1320 + CFG.EXP_MODEL_PARAMS["lookback_window"] - 1)
         )
         query_end_on = last_sync_on
 
         if self.cached_pricing is None:
-            pricing = self.usecase.get_pricing(
+            pricing = self.usecase.get_wide_pricing(
                 start_on=query_start_on, end_on=query_end_on
             )
         else:
             # Get extra 1 candle, cause it has potential to be changed.
-            pricing = self.usecase.get_pricing(
-                start_on=self.cached_pricing.index.levels[0][-1], end_on=query_end_on
+            pricing = self.usecase.get_wide_pricing(
+                start_on=self.cached_pricing.index[-1], end_on=query_end_on
             )
             pricing = pd.concat(
                 [
-                    self.cached_pricing[
-                        query_start_on : self.cached_pricing.index.levels[0][-2]
-                    ],
+                    self.cached_pricing[query_start_on : self.cached_pricing.index[-2]],
                     pricing,
                 ]
             ).sort_index()
 
         self.cached_pricing = pricing
 
-        pricing = pricing.unstack().swaplevel(0, 1, axis=1)
-        features = self._build_features(pricing=pricing)
-        inputs, ids = self._build_inputs(features=features)
-
-        pred_dict = self.model.predict(
-            X=inputs, id=ids, id_to_asset=self.dataset_builder_params["id_to_asset"]
-        )
-
-        return pred_dict
+        return self._build_features(pricing=pricing)
 
     def build_positive_and_negative_assets(self, pred_dict):
         # Set assets which has signals
@@ -378,24 +448,32 @@ class TraderV1:
 
             # Handle max_holding_minutes
             if passed_minutes >= self.max_holding_minutes:
-                self.exit_order(position=position)
+                self.order_executor.submit(
+                    name=f"exit {position.asset}", fn=self.exit_order, position=position
+                )
                 positions[position_idx].is_exited = True
                 logger.info(f"[-] Exit: {str(position)}, max_holding")
                 continue
 
             # Handle exit signal
             if (position.side == "long") and (position.asset in negative_assets):
-                self.exit_order(position=position)
+                self.order_executor.submit(
+                    name=f"exit {position.asset}", fn=self.exit_order, position=position
+                )
                 positions[position_idx].is_exited = True
                 logger.info(f"[-] Exit: {str(position)}, opposite")
                 continue
 
             if (position.side == "short") and (position.asset in positive_assets):
-                self.exit_order(position=position)
+                self.order_executor.submit(
+                    name=f"exit {position.asset}", fn=self.exit_order, position=position
+                )
                 positions[position_idx].is_exited = True
                 logger.info(f"[-] Exit: {str(position)}, opposite")
                 continue
 
+        self.order_executor.wait()
+
         # Delete exited positions
         positions = [
             position for position in positions if position.is_exited is not True
@@ -441,7 +519,9 @@ class TraderV1:
             )
             return is_enough_ammount
 
-        cache = self.custom_cli.get_cache_dict()["free"]
+        cache = self.custom_cli.get_cache_dict(
+            balance=self.custom_cli.get_balance_snapshot()
+        )["free"]
         cost = self.compute_cost_to_order(position=position)
 
         is_enough_cache = bool((cache - cost) >= 0)
@@ -523,21 +603,34 @@ class TraderV1:
 
         executable_order = self.check_if_executable_order(position=position)
         if executable_order is True:
-            ordered = self.custom_cli.entry_order(
-                symbol=position.asset,
-                order_type="market",
-                position=position.side,
-                amount=position.qty,
+            self.order_executor.submit(
+                name=f"entry {position.asset}",
+                fn=self.submit_entry_order,
+                position=position,
+                now=now,
             )
-            if ordered is None:
-                return
 
-            self.last_entry_at[position.asset] = now
+            if self.skip_executable_order_check is False:
+                # Cache check of the next order needs balance after this order
+                self.order_executor.wait()
+                self.custom_cli.invalidate_balance_snapshot()
+
+    def submit_entry_order(self, position, now):
+        ordered = self.custom_cli.entry_order(
+            symbol=position.asset,
+            order_type="market",
+            position=position.side,
+            amount=position.qty,
+        )
+        if ordered is None:
+            return
+
+        self.last_entry_at[position.asset] = now
 
-            if self.exit_if_achieved is True:
-                self.assets_to_limit_order.append(position.asset)
+        if self.exit_if_achieved is True:
+            self.assets_to_limit_order.append(position.asset)
 
-            logger.info(f"[+] Entry: {str(position)}")
+        logger.info(f"[+] Entry: {str(position)}")
 
     def handle_entry(
         self,
@@ -575,16 +668,23 @@ class TraderV1:
                     now=now,
                 )
 
+        self.order_executor.wait()
+        self.custom_cli.invalidate_balance_snapshot()
+
         # Limit order
         if len(self.assets_to_limit_order) > 0:
-            positions = self.custom_cli.get_position_objects(with_entry_at=False)
+            positions = self.custom_cli.get_position_objects(
+                with_entry_at=False, balance=self.custom_cli.get_balance_snapshot()
+            )
 
             for position in positions:
                 if position.asset not in self.assets_to_limit_order:
                     continue
 
                 assert position.entry_price != 0.0
-                self.custom_cli.exit_order(
+                self.order_executor.submit(
+                    name=f"limit exit {position.asset}",
+                    fn=self.custom_cli.exit_order,
                     symbol=position.asset,
                     order_type="limit",
                     position=position.side,
@@ -596,10 +696,15 @@ class TraderV1:
                     ),
                 )
 
+            self.order_executor.wait()
+
     def run(self):
         logger.info(f"[O] Start: demon of trader")
         n_traded = 0
 
+        # Wake up by notification of syncs from data_collector, instead of polling
+        self.usecase.listen_syncs()
+
         while True:
             # Handle relogin
             if n_traded == 60:
@@ -613,6 +718,14 @@ class TraderV1:
                 last_sync_on = self.usecase.get_last_sync_on()
 
                 if self.is_executable(last_sync_on=last_sync_on, now=now) is True:
+                    self.custom_cli.invalidate_balance_snapshot()
+                    balance_future = self.io_executor.submit(
+                        self.custom_cli.get_balance_snapshot
+                    )
+                    pricing_future = self.io_executor.submit(
+                        self.custom_cli.get_last_pricing
+                    )
+
                     pred_dict = self.build_prediction_dict(last_sync_on=last_sync_on)
                     (
                         positive_assets,
@@ -621,8 +734,9 @@ class TraderV1:
 
                     # Handle exit
                     positions = self.custom_cli.get_position_objects(
-                        with_entry_at=False
+                        with_entry_at=False, balance=balance_future.result()
                     )
+                    n_positions = len(positions)
                     positions = self.handle_exit(
                         positions=positions,
                         positive_assets=positive_assets,
@@ -637,7 +751,14 @@ class TraderV1:
                     ]
 
                     # Compute how much use cache to order
-                    cache_dict = self.custom_cli.get_cache_dict()
+                    if len(positions) != n_positions:
+                        # Exits change cache, so snapshot before them is stale
+                        self.custom_cli.invalidate_balance_snapshot()
+
+                    cache_dict = self.custom_cli.get_cache_dict(
+                        balance=self.custom_cli.get_balance_snapshot()
+                    )
+
                     capital = cache_dict["total"]
                     cache = cache_dict["free"]
 
@@ -663,7 +784,7 @@ class TraderV1:
                             )
 
                     # Handle entry
-                    pricing = self.custom_cli.get_last_pricing()
+                    pricing = pricing_future.result()
                     self.handle_entry(
                         positions=positions,
                         cache_to_order=cache_to_order,
@@ -680,7 +801,7 @@ class TraderV1:
 
                     n_traded += 1
                 else:
-                    time.sleep(0.1)
+                    self.usecase.wait_syncs(timeout=self.sync_wait_seconds)
 
             except Exception as e:
                 logger.error("[!] Error: ", exc_info=True)